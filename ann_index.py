@@ -0,0 +1,276 @@
+import json
+import os
+
+import numpy as np
+
+from similarity_index import STORAGE_TYPES, BatchResult, normalize_rows, quantize, recall_at_k, top_k_rows
+
+DEFAULT_NPROBE = 16
+
+
+def default_num_lists(num_rows):
+    """About 4 * sqrt(N) inverted lists, the usual IVF starting point."""
+    return max(1, min(num_rows, int(round(4 * np.sqrt(num_rows)))))
+
+
+def assign_lists(vectors, centroids, block_rows=65536):
+    """Nearest centroid (by cosine) of every row, computed in row blocks."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_rows):
+        block = normalize_rows(vectors[start:start + block_rows])
+        labels[start:start + block_rows] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, num_clusters, iterations=10, sample_size=None, seed=0):
+    """Unit-length k-means centroids for cosine similarity, trained on a random sample of rows.
+
+    The sample is 64 rows per cluster by default, which is enough for coarse
+    quantization and keeps training time independent of the catalog size.
+    Clusters that end up empty are re-seeded with random sample rows.
+    """
+    rng = np.random.default_rng(seed)
+    num_rows = len(vectors)
+    sample_size = min(num_rows, sample_size or 64 * num_clusters)
+    sample = normalize_rows(vectors[np.sort(rng.choice(num_rows, size=sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, size=num_clusters, replace=False)]
+    for _ in range(iterations):
+        labels = assign_lists(sample, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=num_clusters)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.empty_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+        sums[~filled] = sample[rng.choice(sample_size, size=int((~filled).sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Approximate cosine top-k search (inverted file over spherical k-means lists).
+
+    Every vector is filed under its nearest centroid; the vectors of each list are
+    stored contiguously, so a query scores the nprobe lists whose centroids are
+    closest to it instead of the whole catalog. nprobe trades speed for recall
+    (nprobe = num_lists is an exact search); nprobe_for_recall picks it from a
+    target. Same query interface as similarity_index.SimilarityIndex. save()
+    writes plain .npy files that load() memory-maps, so processes share one
+    page-cached copy and only the probed lists are read from disk.
+    """
+
+    def __init__(self, drug_ids, centroids, offsets, order, vectors, vector_scale=None, nprobe=DEFAULT_NPROBE,
+                 block_size=1024):
+        self.drug_ids = np.asarray(drug_ids, dtype=str)
+        self.positions = {drug_id: i for i, drug_id in enumerate(self.drug_ids)}
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.order = order  # list position -> row
+        self.vectors = vectors  # normalized vectors in list order
+        self.vector_scale = vector_scale
+        self.storage = {np.dtype(np.float32): "float32", np.dtype(np.float16): "float16",
+                        np.dtype(np.int8): "int8"}[np.dtype(vectors.dtype)]
+        self.nprobe = nprobe
+        self.block_size = block_size
+        self.slots = np.empty(len(order), dtype=np.int64)  # row -> list position
+        self.slots[np.asarray(order)] = np.arange(len(order))
+
+    @classmethod
+    def build(cls, drug_ids, latent, num_lists=None, nprobe=DEFAULT_NPROBE, storage="float32", iterations=10,
+              sample_size=None, seed=0):
+        """Cluster the latent vectors into num_lists lists (default: default_num_lists) and index them."""
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"storage must be one of {STORAGE_TYPES}, got {storage!r}")
+        num_lists = min(num_lists or default_num_lists(len(latent)), len(latent))
+        centroids = spherical_kmeans(latent, num_lists, iterations, sample_size, seed)
+        labels = assign_lists(latent, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=num_lists))])
+        vectors, vector_scale = quantize(latent[order], storage)
+        return cls(drug_ids, centroids, offsets, order, vectors, vector_scale, nprobe)
+
+    def save(self, directory):
+        """Write the index under directory, replacing any index saved there.
+
+        meta.json is removed first and written last, so load() never sees a
+        half-written index; arrays are written to temporary files and renamed, so
+        processes that memory-mapped the previous files keep valid copies.
+        """
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        arrays = {"drug_ids": self.drug_ids, "centroids": self.centroids, "offsets": self.offsets,
+                  "order": self.order, "vectors": self.vectors}
+        if self.vector_scale is not None:
+            arrays["vector_scale"] = self.vector_scale
+        for name, array in arrays.items():
+            tmp_path = os.path.join(directory, f"{name}.tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        stale_scale = os.path.join(directory, "vector_scale.npy")
+        if self.vector_scale is None and os.path.exists(stale_scale):
+            os.remove(stale_scale)
+        tmp_meta = meta_path + ".tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump({"num_lists": self.num_lists, "num_drugs": len(self), "storage": self.storage,
+                       "nprobe": self.nprobe}, f, indent=2)
+        os.replace(tmp_meta, meta_path)
+        return directory
+
+    @classmethod
+    def load(cls, directory, nprobe=None, mmap=True):
+        """A saved index (vectors and list order memory-mapped), or None if there is none."""
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        scale_path = os.path.join(directory, "vector_scale.npy")
+        return cls(
+            np.load(os.path.join(directory, "drug_ids.npy")),
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "offsets.npy")),
+            np.load(os.path.join(directory, "order.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "vectors.npy"), mmap_mode=mmap_mode),
+            np.load(scale_path) if os.path.exists(scale_path) else None,
+            nprobe or meta["nprobe"],
+        )
+
+    def __len__(self):
+        return len(self.drug_ids)
+
+    def __contains__(self, drug_id):
+        return drug_id in self.positions
+
+    @property
+    def num_lists(self):
+        return len(self.centroids)
+
+    @property
+    def nbytes(self):
+        """Memory held by the stored vectors, centroids and list order."""
+        scale_bytes = 0 if self.vector_scale is None else self.vector_scale.nbytes
+        return self.vectors.nbytes + self.centroids.nbytes + self.order.nbytes + scale_bytes
+
+    def float_vectors(self, rows):
+        """Stored vectors of the given rows as L2-normalized float32."""
+        vectors = self.vectors[self.slots[np.asarray(rows)]].astype(np.float32)
+        if self.vector_scale is None:
+            return vectors
+        return normalize_rows(vectors * self.vector_scale)
+
+    def search_vectors(self, query_vectors, k, nprobe=None, exclude_rows=None):
+        """Rows and scores of the approximate top-k for normalized query vectors, best first.
+
+        Queries are grouped by the lists they probe, so each list is read once per
+        call. exclude_rows (one per query, or -1) are left out of the results. Where
+        the probed lists hold fewer than k vectors, rows are -1 and scores -inf.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        num_queries = len(query_vectors)
+        nprobe = max(1, min(nprobe or self.nprobe, self.num_lists))
+        probes, _ = top_k_rows(query_vectors @ self.centroids.T, nprobe)
+        if self.vector_scale is not None:
+            # int8: fold the per-dimension scale into the queries
+            query_vectors = query_vectors * self.vector_scale
+
+        if num_queries == 1:
+            return self._search_one(query_vectors[0], probes[0], k,
+                                    None if exclude_rows is None else exclude_rows[0])
+
+        candidate_rows = np.full((num_queries, nprobe, k), -1, dtype=np.int64)
+        candidate_scores = np.full((num_queries, nprobe, k), -np.inf, dtype=np.float32)
+        probed = probes.ravel()
+        pairs = np.argsort(probed, kind="stable")
+        for group in np.split(pairs, np.flatnonzero(np.diff(probed[pairs])) + 1):
+            start, end = self.offsets[probed[group[0]]], self.offsets[probed[group[0]] + 1]
+            if start == end:
+                continue
+            queries, ranks = np.divmod(group, nprobe)
+            sims = query_vectors[queries] @ self.vectors[start:end].astype(np.float32).T
+            if exclude_rows is not None:
+                own = self.slots[exclude_rows[queries]] - start
+                inside = (exclude_rows[queries] >= 0) & (own >= 0) & (own < end - start)
+                sims[np.flatnonzero(inside), own[inside]] = -np.inf
+            top, scores = top_k_rows(sims, k)
+            candidate_rows[queries, ranks, :top.shape[1]] = self.order[start + top]
+            candidate_scores[queries, ranks, :top.shape[1]] = scores
+
+        top, scores = top_k_rows(candidate_scores.reshape(num_queries, -1), k)
+        rows = np.take_along_axis(candidate_rows.reshape(num_queries, -1), top, axis=1)
+        rows[~np.isfinite(scores)] = -1
+        return rows, scores
+
+    def _search_one(self, query_vector, lists, k, exclude_row=None):
+        """search_vectors for a single query: the probed lists are scored in one product."""
+        slots = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+        sims = self.vectors[slots].astype(np.float32) @ query_vector
+        if exclude_row is not None and exclude_row >= 0:
+            sims[slots == self.slots[exclude_row]] = -np.inf
+        top, scores = top_k_rows(sims[None, :], k)
+        rows = np.full((1, k), -1, dtype=np.int64)
+        rows[0, :top.shape[1]] = self.order[slots[top[0]]]
+        padded = np.full((1, k), -np.inf, dtype=np.float32)
+        padded[0, :top.shape[1]] = scores[0]
+        rows[~np.isfinite(padded)] = -1
+        return rows, padded
+
+    def _search_rows(self, rows, k, nprobe=None):
+        """Top-k neighbors for indexed rows (never the row itself), in query blocks."""
+        neighbors = np.empty((len(rows), k), dtype=np.int64)
+        scores = np.empty((len(rows), k), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block_rows = rows[start:start + self.block_size]
+            block = slice(start, start + len(block_rows))
+            neighbors[block], scores[block] = self.search_vectors(self.float_vectors(block_rows), k, nprobe,
+                                                                  exclude_rows=block_rows)
+        return neighbors, scores
+
+    def query(self, drug_id, k=5, nprobe=None):
+        """Return (neighbor_ids, scores) for drug_id, or None if the ID is not indexed."""
+        row = self.positions.get(drug_id)
+        if row is None:
+            return None
+        k = min(k, len(self) - 1)
+        positions, scores = self._search_rows(np.array([row]), k, nprobe)
+        found = positions[0] >= 0
+        return self.drug_ids[positions[0][found]], scores[0][found]
+
+    def query_batch(self, drug_ids, k=5, nprobe=None):
+        """Neighbors for many drug IDs; rows the probed lists could not fill hold "" / nan."""
+        query_ids = np.asarray(drug_ids, dtype=str)
+        rows = np.array([self.positions.get(drug_id, -1) for drug_id in query_ids], dtype=np.int64)
+        missing = rows < 0
+        k = min(k, len(self) - 1)
+
+        neighbors = np.full((len(query_ids), k), -1, dtype=np.int64)
+        scores = np.full((len(query_ids), k), np.nan, dtype=np.float32)
+        hits = np.flatnonzero(~missing)
+        neighbors[hits], scores[hits] = self._search_rows(rows[hits], k, nprobe)
+
+        unfilled = neighbors < 0
+        neighbor_ids = self.drug_ids[np.where(unfilled, 0, neighbors)]
+        neighbor_ids[unfilled] = ""
+        scores[unfilled] = np.nan
+        neighbor_ids[missing] = ""
+        return BatchResult(query_ids, neighbor_ids, scores, missing)
+
+    def nprobe_for_recall(self, target_recall=0.95, k=10, sample_size=200, seed=0):
+        """Smallest power-of-two nprobe reaching target_recall@k on a sample of drugs; sets and returns it.
+
+        The reference is an exhaustive scan of the same stored vectors.
+        """
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(self), size=min(sample_size, len(self)), replace=False)
+        k = min(k, len(self) - 1)
+        exact, _ = self._search_rows(rows, k, self.num_lists)
+        nprobe = 1
+        while nprobe < self.num_lists:
+            approx, _ = self._search_rows(rows, k, nprobe)
+            if recall_at_k(approx, exact) >= target_recall:
+                break
+            nprobe *= 2
+        self.nprobe = min(nprobe, self.num_lists)
+        return self.nprobe
@@ -0,0 +1,123 @@
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from sqlite_db import STATS_TABLE, connect, ensure_parent_dir, increment
+
+DEFAULT_ANSWER_CACHE_PATH = "./cache/answers.sqlite"
+
+
+def normalize_question(question):
+    """Lowercase, strip punctuation and collapse whitespace so trivial rewordings share a key."""
+    text = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """Chatbot answer cache in SQLite, shared by all sessions and processes.
+
+    Lookups first match the normalized question text exactly; if an embed(text)
+    function is given, a miss falls back to the most similar cached question whose
+    cosine similarity reaches similarity_threshold. Entries expire after ttl_seconds
+    and the least recently used are evicted beyond max_entries. Hit and miss
+    counters are stored with the cache.
+    """
+
+    def __init__(self, path=DEFAULT_ANSWER_CACHE_PATH, ttl_seconds=7 * 24 * 3600, max_entries=5000,
+                 embed=None, similarity_threshold=0.92):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        ensure_parent_dir(path)
+        with connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL, embedding BLOB, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)")
+            conn.execute(STATS_TABLE)
+
+    @staticmethod
+    def _key(normalized):
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def _embedding(self, normalized):
+        if self.embed is None:
+            return None
+        try:
+            vector = np.asarray(self.embed(normalized), dtype=np.float32)
+        except Exception:
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, question):
+        """Return (answer, embedding) -- answer is None on a miss; pass the embedding on to put()."""
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock, connect(self.path) as conn:
+            conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_seconds,))
+            row = conn.execute("SELECT answer FROM answers WHERE key = ?", (self._key(normalized),)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE answers SET accessed = ? WHERE key = ?", (now, self._key(normalized)))
+                increment(conn, "exact_hits")
+                metrics.count("answer_cache_lookups", result="hit", match="exact")
+                return row[0], None
+
+        embedding = self._embedding(normalized)
+        with self._lock, connect(self.path) as conn:
+            if embedding is not None:
+                rows = conn.execute("SELECT key, answer, embedding FROM answers WHERE embedding IS NOT NULL").fetchall()
+                if rows:
+                    stored = np.stack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in rows])
+                    if stored.shape[1] == len(embedding):
+                        similarities = stored @ embedding
+                        best = int(np.argmax(similarities))
+                        if similarities[best] >= self.similarity_threshold:
+                            conn.execute("UPDATE answers SET accessed = ? WHERE key = ?", (now, rows[best][0]))
+                            increment(conn, "semantic_hits")
+                            metrics.count("answer_cache_lookups", result="hit", match="semantic")
+                            return rows[best][1], embedding
+            increment(conn, "misses")
+        metrics.count("answer_cache_lookups", result="miss")
+        return None, embedding
+
+    def put(self, question, answer, embedding=None):
+        normalized = normalize_question(question)
+        now = time.time()
+        blob = None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock, connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, question, answer, embedding, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(normalized), normalized, answer, blob, now, now),
+            )
+            evicted = conn.execute(
+                "DELETE FROM answers WHERE key IN "
+                "(SELECT key FROM answers ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            increment(conn, "evictions", evicted)
+
+    def stats(self):
+        with self._lock, connect(self.path) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        exact, semantic, misses = (counters.get(name, 0) for name in ("exact_hits", "semantic_hits", "misses"))
+        lookups = exact + semantic + misses
+        return {
+            "exact_hits": exact,
+            "semantic_hits": semantic,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": (exact + semantic) / lookups if lookups else 0.0,
+            "entries": entries,
+        }
@@ -1,17 +1,53 @@
 import streamlit as st
 import pandas as pd
-import requests
-import httpx
+import asyncio
 import json
 import os
 
-from google import genai
-from google.genai import types
-
-from drug_discovery import train_autoencoder, get_similar_drugs_autoencoder
+import metrics
+from answer_cache import AnswerCache
+from batch_extraction import extract_document, extract_many
+from chat_memory import ChatMemory
+from extraction import DEFAULT_MODEL, EXTRACTION_PROMPT, extraction_config, parse_extraction, parse_stats
+from extraction_cache import ExtractionCache
+from genai_gateway import INTERACTIVE, GenAIGateway
+from results_store import ResultsStore
+from url_fetcher import UrlFetcher
 
 GENAI_KEY = os.getenv("GENAI_KEY")
-client = genai.Client(api_key=GENAI_KEY)
+GENAI_MODEL = DEFAULT_MODEL
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "./cache/extractions.sqlite")
+RESULTS_STORE_PATH = os.getenv("RESULTS_STORE_PATH", "./data/extractions.sqlite")  # searchable extraction history
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "8"))  # documents in flight in batch mode
+MAX_DOCUMENT_MB = int(os.getenv("MAX_DOCUMENT_MB", "50"))  # downloads stop past this size
+PDF_CHUNK_PAGES = int(os.getenv("PDF_CHUNK_PAGES", "20"))  # longer PDFs are extracted in parallel page chunks
+CHAT_VISIBLE_MESSAGES = 20  # chat messages rendered by default; older ones behind a toggle
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))  # recent turns sent verbatim
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "./cache/answers.sqlite")
+# Exact question matches only by default; e.g. 0.95 also reuses answers to very similar questions
+# (questions differing only in population, such as children vs adults, can score above 0.9)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+EMBEDDING_MODEL = "text-embedding-004"
+CHAT_INSTRUCTION = "You are a knowledgeable pharmaceutical expert. You will give medical advice that will not have legal consequences. Answer the following question concisely."
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "20"))  # neighbors precomputed per drug
+SIMILARITY_STORAGE = os.getenv("SIMILARITY_STORAGE", "float32")  # float32, float16 or int8
+SIMILARITY_ANN = os.getenv("SIMILARITY_ANN", "0") == "1"  # approximate (IVF) search for very large catalogs
+SIMILARITY_NPROBE = int(os.getenv("SIMILARITY_NPROBE", "16"))  # IVF lists scanned per query: higher = better recall
+GENAI_REQUESTS_PER_MINUTE = int(os.getenv("GENAI_REQUESTS_PER_MINUTE", "60"))  # shared by all sessions
+GENAI_BURST = int(os.getenv("GENAI_BURST", "5"))
+RATINGS_FILE = os.getenv("RATINGS_FILE", "./ratings_mat.csv")
+
+# Heavy dependencies (google.genai, and torch/sklearn via drug_discovery) are imported
+# on first use inside cache_resource functions, so cold starts and reruns skip them
+@st.cache_resource
+def get_genai_client():
+    from google import genai
+    return genai.Client(api_key=GENAI_KEY)
+
+@st.cache_resource
+def get_gateway():
+    """One rate limiter/scheduler per process: every GenAI call from every session goes through it."""
+    return GenAIGateway(get_genai_client, requests_per_minute=GENAI_REQUESTS_PER_MINUTE, burst=GENAI_BURST)
 
 st.markdown("""
     <style>
@@ -25,77 +61,94 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def extract_data_from_text(response_text):
-    """Extract JSON data wrapped in markdown formatting from the response."""
-    if "```json" not in response_text:
-        st.error("The response did not contain the expected JSON formatting.")
-        return {}
+    """Parse the model's JSON response, recovering what it can from fenced, wrapped or cut-off output."""
     try:
-        json_str = response_text.split("```json")[1].split("```")[0].strip()
-        data = json.loads(json_str)
-    except Exception as e:
-        st.error(f"Error extracting data: {str(e)}")
-        data = {}
+        return parse_extraction(response_text)
+    except ValueError as e:
+        st.error(str(e))
+        return {}
+
+@st.cache_resource
+def get_extraction_cache():
+    return ExtractionCache(EXTRACTION_CACHE_PATH)
+
+@st.cache_resource
+def get_results_store():
+    return ResultsStore(RESULTS_STORE_PATH)
+
+def generate_extraction(content_bytes, mime_type, source=None):
+    """Generate content extraction using the GenAI API (cached by document, prompt and model).
+
+    PDFs longer than PDF_CHUNK_PAGES are split into page chunks that are extracted
+    concurrently and merged field by field. Results are saved to the results store;
+    documents already stored are not sent to the model again. Fields are shown in a
+    preview table as the response streams in.
+    """
+    preview = st.empty()
+    with metrics.span("generate_extraction"):
+        data = asyncio.run(extract_document(
+            get_gateway(), prompt, GENAI_MODEL, content_bytes, extract_data_from_text,
+            cache=get_extraction_cache(), mime_type=mime_type, pages_per_chunk=PDF_CHUNK_PAGES,
+            store=get_results_store(), source=source, config=extraction_config(),
+            on_partial=lambda partial: preview.dataframe(pd.DataFrame([partial])),
+        ))
+    preview.empty()
     return data
 
-def generate_extraction(content_bytes, mime_type):
-    """Generate content extraction using the GenAI API."""
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[
-            prompt,
-            types.Part.from_bytes(data=content_bytes, mime_type=mime_type)
-        ]
-    )
-    return extract_data_from_text(response.text)
+@st.cache_resource
+def get_url_fetcher():
+    """One pooled HTTP client per process, shared by every session."""
+    return UrlFetcher(max_bytes=MAX_DOCUMENT_MB * 1024 * 1024)
 
 @st.cache_data(show_spinner=False)
 def fetch_url_content(url):
     """Fetch and return the content from a URL if it appears to be a PDF."""
     try:
-        r = requests.head(url, allow_redirects=True)
-        content_type = r.headers.get("Content-Type", "").lower()
-        if "pdf" not in content_type:
+        result = get_url_fetcher().fetch(url)
+        if "pdf" not in result.content_type.lower():
             st.warning("The URL does not appear to point to a PDF. Attempting to process anyway.")
-        # Cache the full content
-        doc = httpx.get(url).content
-        return doc
+        return result.content
     except Exception as e:
         st.error(f"Error fetching URL: {str(e)}")
         return None
 
-prompt = """
-{
-"task": "You are a medical and genetic expert. I am providing you with a medical paper or report regarding a genetic variant. Your task is to extract the following key information from the text.",
-"fields": {
-    "Variant": "The identifier of the genetic variant (e.g., rsID like rs113993960).",
-    "Genes": "The gene(s) associated with the variant (e.g., CFTR).",
-    "Drugs": "The drug(s) or treatment(s) associated with the variant or condition.",
-    "Association": "The relationship between the genetic variant and the associated condition or phenotype.",
-    "Significance": "The reported significance of the association (e.g., not stated, significant, etc.).",
-    "P-Value": "The p-value associated with the statistical analysis of the variant's significance.",
-    "Number of Cases": "The number of cases or individuals with the condition.",
-    "Number of Controls": "The number of controls or individuals without the condition.",
-    "Biogeographical Groups": "Information on the biogeographical groups or populations analyzed.",
-    "Phenotype Categories": "The phenotype categories or traits related to the variant.",
-    "Pediatric": "Any details regarding pediatric (children) cases or studies mentioned.",
-    "More Details": "Any additional details, such as mechanisms, biological processes, etc.",
-    "Literature": "PMID or DOI of the original paper or report."
-},
-"example_report": {
-    "Variant": "rs113993960",
-    "Genes": "CFTR",
-    "Drugs": "ivacaftor / lumacaftor",
-    "Association": "Genotype del/del is associated with decreased severity of Exocrine Pancreatic Insufficiency when treated with ivacaftor / lumacaftor in children with Cystic Fibrosis.",
-    "Significance": "not stated",
-    "P-Value": "1",
-    "Number of Cases": "0",
-    "Number of Controls": "Unknown",
-    "Biogeographical Groups": "Efficacy",
-    "Phenotype Categories": "PMIID:34511391"
-},
-"instruction": "I will provide the medical report or paper. Please provide the extracted information. If any information is not present, please state 'Not stated'. Do not return anything except for the required fields."
-}
-"""
+def run_batch_extraction(sources):
+    """Extract many (name, bytes-or-None-for-URL) sources concurrently, streaming rows into a table."""
+    progress = st.progress(0.0, text=f"Extracting 0 of {len(sources)} documents...")
+    table = st.empty()
+    rows, errors = [], []
+
+    async def consume():
+        async for name, data, error in extract_many(
+            sources, get_gateway(), prompt, GENAI_MODEL, extract_data_from_text,
+            cache=get_extraction_cache(), concurrency=EXTRACTION_CONCURRENCY, fetcher=get_url_fetcher(),
+            pages_per_chunk=PDF_CHUNK_PAGES, store=get_results_store(), config=extraction_config(),
+        ):
+            if error:
+                errors.append(f"{name}: {error}")
+            else:
+                rows.append({"Source": name, **data})
+                table.dataframe(pd.DataFrame(rows))
+            done = len(rows) + len(errors)
+            progress.progress(done / len(sources), text=f"Extracted {done} of {len(sources)} documents")
+
+    asyncio.run(consume())
+    for error in errors:
+        st.error(error)
+    return pd.DataFrame(rows)
+
+@st.cache_resource(show_spinner="Loading drug similarity model...", max_entries=1)
+def load_similarity_model(ratings_mtime):
+    """Load (or train once) the autoencoder artifact; cached per process until the ratings file changes."""
+    from drug_discovery import load_or_train, build_similarity_index, load_ann_index
+    if SIMILARITY_ANN:
+        # No exact neighbor table: building one is quadratic in the number of drugs
+        artifact = load_or_train(RATINGS_FILE)
+        return artifact, load_ann_index(artifact, nprobe=SIMILARITY_NPROBE, storage=SIMILARITY_STORAGE)
+    artifact = load_or_train(RATINGS_FILE, precompute_k=SIMILARITY_TOP_K)
+    return artifact, build_similarity_index(artifact, precompute_k=SIMILARITY_TOP_K, storage=SIMILARITY_STORAGE)
+
+prompt = EXTRACTION_PROMPT
 
 st.markdown("""
     <div style="text-align: center; margin-bottom: 20px;">
@@ -105,16 +158,31 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-tabs = st.tabs(["PDF File", "URL", "Chatbot", "Drug Discovery"])
+with st.sidebar.expander("Extraction cache"):
+    cache_stats = get_extraction_cache().stats()
+    st.write(f"Hits: {cache_stats['hits']} | Misses: {cache_stats['misses']} | Hit rate: {cache_stats['hit_rate']:.0%}")
+    st.write(f"Entries: {cache_stats['entries']} ({cache_stats['bytes'] / 1024:.0f} KB)")
+    parses = parse_stats()
+    st.write(f"Responses parsed: {parses['parsed']} | Recovered: {parses['recovered']} | Failed: {parses['failed']}")
+
+with st.sidebar.expander("GenAI requests"):
+    gateway_stats = get_gateway().stats()
+    st.write(f"Sent: {gateway_stats['requests']} | Retries: {gateway_stats['retries']} | Shared in-flight: {gateway_stats['deduplicated']}")
+    st.write(f"Queued: {gateway_stats['queued']} | Deadline exceeded: {gateway_stats['deadline_exceeded']} | Failed: {gateway_stats['failures']}")
+
+tabs = st.tabs(["PDF File", "URL", "Chatbot", "Drug Discovery", "Search"])
 
 # ---------------- PDF Tab ----------------
 with tabs[0]:
     st.subheader("Upload a PDF File")
-    uploaded_file = st.file_uploader("Choose a PDF file", type='pdf')
+    uploaded_files = st.file_uploader("Choose one or more PDF files", type='pdf', accept_multiple_files=True)
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
+    if len(uploaded_files) > 1:
+        run_batch_extraction([(f.name, f.getvalue()) for f in uploaded_files])
     if uploaded_file is not None:
         with st.spinner("Extracting metadata from PDF..."):
             file_bytes = uploaded_file.getvalue()
-            extracted_data = generate_extraction(file_bytes, mime_type='application/pdf')
+            extracted_data = generate_extraction(file_bytes, mime_type='application/pdf', source=uploaded_file.name)
         if extracted_data:
             df = pd.DataFrame([extracted_data])
             # st.markdown('<div style="background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);">', unsafe_allow_html=True)
@@ -131,7 +199,7 @@ with tabs[1]:
         with st.spinner("Fetching and processing URL content..."):
             doc_data = fetch_url_content(url)
             if doc_data:
-                extracted_data = generate_extraction(doc_data, mime_type='application/pdf')
+                extracted_data = generate_extraction(doc_data, mime_type='application/pdf', source=url)
                 if extracted_data:
                     df = pd.DataFrame([extracted_data])
                     # st.markdown('<div style="background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);">', unsafe_allow_html=True)
@@ -142,39 +210,90 @@ with tabs[1]:
             else:
                 st.error("Failed to fetch content from the URL.")
 
+    batch_urls = st.text_area("Or enter many URLs, one per line:")
+    urls = [line.strip() for line in batch_urls.splitlines() if line.strip()]
+    if urls and st.button("Extract all URLs"):
+        run_batch_extraction([(batch_url, None) for batch_url in urls])
+
 # ---------------- Chatbot Tab ----------------
-with tabs[2]:
-    st.subheader("Medical Chatbot")
-    st.write("Ask any drug or disease medical question below and get a response.")
+def render_chat_messages(messages):
+    for chat in messages:
+        with st.chat_message("user" if chat["role"] == "user" else "assistant"):
+            st.markdown(chat["content"])
 
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+def embed_question(text):
+    return get_gateway().embed(EMBEDDING_MODEL, text)
 
-    with st.form("chat_form", clear_on_submit=True):
-        user_question = st.text_input("Your Question:")
-        submitted = st.form_submit_button("Send")
-        if submitted and user_question:
-            st.session_state.chat_history.append({"role": "user", "content": user_question})
+@st.cache_resource
+def get_answer_cache():
+    embed = embed_question if ANSWER_CACHE_SIMILARITY > 0 else None
+    return AnswerCache(ANSWER_CACHE_PATH, embed=embed, similarity_threshold=ANSWER_CACHE_SIMILARITY)
 
-            chat_prompt = (
-                f"You are a knowledgeable pharmaceutical expert. You will give medical advice that will not have legal consequences. Answer the following question concisely:\n\n"
-                f"Question: {user_question}\nAnswer:"
-            )
+def summarize_chat(summary_prompt):
+    # Compaction runs inside the chat fragment, so it must not queue behind batch extraction
+    response = get_gateway().generate(GENAI_MODEL, [summary_prompt], priority=INTERACTIVE)
+    return response.text
 
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[chat_prompt]
-            )
-            bot_answer = response.text.strip()
+@st.fragment
+def chat_panel():
+    """Chat UI as a fragment: a new message reruns only this panel, not the whole app."""
+    if "chat_memory" not in st.session_state:
+        st.session_state.chat_memory = ChatMemory(window_tokens=CHAT_CONTEXT_TOKENS)
+    memory = st.session_state.chat_memory
+    history = memory.messages
 
-            st.session_state.chat_history.append({"role": "bot", "content": bot_answer})
+    # Only the most recent messages are rendered on each rerun; older ones on request
+    hidden = max(len(history) - CHAT_VISIBLE_MESSAGES, 0)
+    if hidden and st.toggle(f"Show {hidden} earlier messages"):
+        render_chat_messages(history[:hidden])
+    messages = st.container()
+    with messages:
+        render_chat_messages(history[hidden:])
 
-    if st.session_state.chat_history:
-        for chat in st.session_state.chat_history:
-            if chat["role"] == "user":
-                st.markdown(f"**You:** {chat['content']}")
-            else:
-                st.markdown(f"**Bot:** {chat['content']}")
+    if history and st.button("New conversation"):
+        st.session_state.chat_memory = ChatMemory(window_tokens=CHAT_CONTEXT_TOKENS)
+        st.rerun(scope="fragment")
+
+    user_question = st.chat_input("Your Question:")
+    if user_question:
+        # Cached answers are only valid for standalone questions, not follow-ups
+        standalone = not memory.messages and not memory.summary
+        answer_cache = get_answer_cache()
+        cached_answer, question_embedding = answer_cache.get(user_question) if standalone else (None, None)
+
+        # Summary of older turns + recent turns under the token budget + the new question
+        chat_prompt = memory.build_prompt(CHAT_INSTRUCTION, user_question)
+        memory.add("user", user_question)
+        with messages:
+            render_chat_messages(history[-1:])
+
+            with st.chat_message("assistant"):
+                if cached_answer is not None:
+                    st.markdown(cached_answer)
+                    st.caption("Answered from cache")
+                    bot_answer = cached_answer
+                else:
+                    # Stream tokens into the page as they arrive
+                    with metrics.span("chat_answer"):
+                        stream = get_gateway().generate_stream(GENAI_MODEL, [chat_prompt])
+                        bot_answer = str(st.write_stream(chunk.text for chunk in stream if chunk.text)).strip()
+                    metrics.observe("chat_answer_chars", len(bot_answer))
+                    if standalone and bot_answer:
+                        answer_cache.put(user_question, bot_answer, question_embedding)
+
+        memory.add("bot", bot_answer)
+        # After the answer is shown: fold old turns into the summary and apply the memory cap
+        memory.compact(summarize_chat)
+
+with st.sidebar.expander("Chat answer cache"):
+    answer_stats = get_answer_cache().stats()
+    st.write(f"Exact hits: {answer_stats['exact_hits']} | Similar-question hits: {answer_stats['semantic_hits']} | Misses: {answer_stats['misses']}")
+    st.write(f"Hit rate: {answer_stats['hit_rate']:.0%} | Entries: {answer_stats['entries']}")
+
+with tabs[2]:
+    st.subheader("Medical Chatbot")
+    st.write("Ask any drug or disease medical question below and get a response.")
+    chat_panel()
 
 # ---------------- Drug Discovery Tab ----------------
 with tabs[3]:
@@ -185,8 +304,71 @@ with tabs[3]:
         drug_input = st.text_input("Enter a PubChem id:")
         submitted_drug = st.form_submit_button("Find Similar Drug")
         if submitted_drug and drug_input:
-            sim_df = train_autoencoder()
-            similar_drug = get_similar_drugs_autoencoder(drug_input, sim_df)
+            from drug_discovery import get_similar_drugs_autoencoder
+            _, sim_index = load_similarity_model(os.path.getmtime(RATINGS_FILE))
+            similar_drug = get_similar_drugs_autoencoder(drug_input, sim_index)
             st.write(f"Drug query: {drug_input} | Similar drugs:")
             st.table(similar_drug)
-            # st.success(f"Drug query: {drug_input} | Similar drugs: {similar_drug}")
\ No newline at end of file
+            # st.success(f"Drug query: {drug_input} | Similar drugs: {similar_drug}")
+
+    st.write("Or look up many drugs at once: paste PubChem ids (comma, space or newline separated) or upload a CSV whose first column holds the ids.")
+    with st.form("drug_batch_form"):
+        pasted_ids = st.text_area("PubChem ids:")
+        ids_file = st.file_uploader("CSV of PubChem ids", type="csv")
+        batch_k = st.number_input("Similar drugs per id", min_value=1, max_value=100, value=5)
+        submitted_batch = st.form_submit_button("Find Similar Drugs")
+        if submitted_batch:
+            query_ids = pasted_ids.replace(",", " ").split()
+            if ids_file is not None:
+                file_ids = pd.read_csv(ids_file, dtype=str, header=None).iloc[:, 0].dropna().str.strip().tolist()
+                # An optional header row: PubChem ids are numeric
+                query_ids += file_ids[1:] if file_ids and not file_ids[0].isdigit() else file_ids
+            if query_ids:
+                from drug_discovery import get_similar_drugs_batch, batch_result_frame
+                _, sim_index = load_similarity_model(os.path.getmtime(RATINGS_FILE))
+                result = get_similar_drugs_batch(query_ids, sim_index, top_n=int(batch_k))
+                st.write(f"{int((~result.missing).sum())} of {len(result.query_ids)} ids found:")
+                st.dataframe(batch_result_frame(result))
+                if result.missing.any():
+                    st.warning("Not found in dataset: " + ", ".join(result.query_ids[result.missing]))
+
+# ---------------- Search Tab ----------------
+with tabs[4]:
+    st.subheader("Search Extracted Papers")
+    store_stats = get_results_store().stats()
+    st.write(f"{store_stats['papers']} papers from {store_stats['documents']} extracted documents. "
+             "Enter one or more terms; papers matching all of them are listed.")
+    search_columns = st.columns(4)
+    search_variant = search_columns[0].text_input("Variant", placeholder="rs113993960")
+    search_gene = search_columns[1].text_input("Gene", placeholder="CFTR")
+    search_drug = search_columns[2].text_input("Drug", placeholder="ivacaftor")
+    search_literature = search_columns[3].text_input("PMID / DOI")
+    if any((search_variant, search_gene, search_drug, search_literature)):
+        matches = get_results_store().search(search_variant, search_gene, search_drug, search_literature)
+        if matches:
+            st.dataframe(pd.DataFrame(matches))
+        else:
+            st.info("No stored papers match these terms.")
+
+# ---------------- Diagnostics ----------------
+# Rendered last so it includes this run's spans; shown only when PHARMORE_METRICS is set
+if metrics.enabled():
+    with st.sidebar.expander("Diagnostics"):
+        rates = metrics.hit_rates()
+        if rates:
+            st.write(" | ".join(f"{name.replace('_lookups', '')} hit rate: {rate:.0%}" for name, rate in rates.items()))
+        current = metrics.snapshot()
+        if current["summaries"]:
+            st.dataframe(pd.DataFrame([{
+                "Metric": summary["name"],
+                "Labels": ", ".join(f"{key}={value}" for key, value in summary["labels"].items()),
+                "Count": summary["count"], "Mean": summary["mean"], "Max": summary["max"], "Total": summary["sum"],
+            } for summary in current["summaries"]]))
+        if current["counters"]:
+            st.dataframe(pd.DataFrame([{
+                "Counter": counter["name"],
+                "Labels": ", ".join(f"{key}={value}" for key, value in counter["labels"].items()),
+                "Value": counter["value"],
+            } for counter in current["counters"]]))
+        st.download_button("Prometheus metrics", metrics.prometheus_text(), file_name="pharmore_metrics.prom")
+        st.download_button("JSON snapshot", json.dumps(current), file_name="pharmore_metrics.json")
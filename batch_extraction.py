@@ -0,0 +1,154 @@
+import asyncio
+import pathlib
+
+import metrics
+from chunked_extraction import chunk_prompt, merge_extractions, split_pdf
+from extraction import StreamingExtractionParser
+from extraction_cache import extraction_key
+from results_store import document_hash, extractor_id
+from genai_gateway import BATCH, EXTRACTION
+from url_fetcher import UrlFetcher
+
+
+async def extract_document(gateway, prompt, model, content_bytes, parse, cache=None, mime_type="application/pdf",
+                           pages_per_chunk=None, chunk_concurrency=4, priority=EXTRACTION, executor=None,
+                           store=None, source=None, config=None, on_partial=None):
+    """Extract one document through a genai_gateway.GenAIGateway (async GenAI client).
+
+    With pages_per_chunk set, PDFs longer than that are split into page ranges that
+    are extracted concurrently (at most chunk_concurrency at once) and merged with
+    chunked_extraction.merge_extractions. PDF splitting runs in `executor` (e.g. a
+    process pool) or the default thread pool, off the event loop. With a
+    results_store.ResultsStore, documents already extracted with the same model and
+    prompt are answered from it and new results are added to it under `source`.
+
+    config is passed to generate_content (e.g. extraction.extraction_config() for
+    schema-constrained JSON). With on_partial, the response is streamed and
+    on_partial(fields so far) is called as they arrive; chunked documents report
+    the merge of the chunks finished so far instead.
+    """
+    doc_hash = document_hash(content_bytes) if store is not None else None
+    extractor = extractor_id(model, prompt) if store is not None else None
+    if store is not None:
+        stored = store.get(doc_hash, extractor)
+        if stored is not None:
+            return stored
+
+    metrics.observe("extraction_document_bytes", len(content_bytes))
+    key = extraction_key(content_bytes, prompt, model)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    chunks = []
+    if pages_per_chunk and mime_type == "application/pdf":
+        chunks = await asyncio.get_running_loop().run_in_executor(executor, split_pdf, content_bytes, pages_per_chunk)
+    if len(chunks) > 1:
+        data = await extract_chunks(gateway, prompt, model, chunks, parse, cache, chunk_concurrency, priority,
+                                    config, on_partial)
+    else:
+        from google.genai import types
+        contents = [
+            prompt,
+            types.Part.from_bytes(data=content_bytes, mime_type=mime_type)
+        ]
+        if on_partial is None:
+            response = await gateway.agenerate(model, contents, priority=priority, config=config)
+            text = response.text or ""
+        else:
+            text = await stream_extraction(gateway, model, contents, priority, config, on_partial)
+        metrics.observe("extraction_response_chars", len(text))
+        data = parse(text)
+        if not data:
+            metrics.count("extraction_empty_results")
+    if data and cache is not None:
+        cache.put(key, data)
+    if data and store is not None:
+        store.add(doc_hash, data, source, extractor)
+    return data
+
+
+async def stream_extraction(gateway, model, contents, priority, config, on_partial):
+    """Stream one response, calling on_partial with the fields recovered so far; returns the full text."""
+    parser = StreamingExtractionParser()
+    shown = None
+    async for chunk in gateway.agenerate_stream(model, contents, priority=priority, config=config):
+        partial = parser.feed(chunk.text or "")
+        if partial and partial != shown:
+            shown = partial
+            on_partial(partial)
+    return parser.text
+
+
+async def extract_chunks(gateway, prompt, model, chunks, parse, cache=None, concurrency=4, priority=EXTRACTION,
+                         config=None, on_partial=None):
+    """Map: extract each (first_page, last_page, bytes) chunk concurrently. Reduce: merge in page order.
+
+    A chunk that fails is counted (extraction_failed_chunks) and left out of the
+    merge; the error is raised only if every chunk failed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    num_pages = chunks[-1][1]
+    finished = {}
+
+    async def run(first_page, last_page, chunk_bytes):
+        async with semaphore:
+            result = await extract_document(gateway, chunk_prompt(prompt, first_page, last_page, num_pages),
+                                            model, chunk_bytes, parse, cache, priority=priority, config=config)
+        if result and on_partial is not None:
+            finished[first_page] = result
+            on_partial(merge_extractions([finished[page] for page in sorted(finished)]))
+        return result
+
+    results = await asyncio.gather(*(run(*chunk) for chunk in chunks), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        metrics.count("extraction_failed_chunks", len(errors))
+        if len(errors) == len(results):
+            raise errors[0]
+    results = [result for result in results if result and not isinstance(result, BaseException)]
+    return merge_extractions(results) if results else {}
+
+
+def is_url(name):
+    return name.startswith(("http://", "https://"))
+
+
+async def extract_many(sources, gateway, prompt, model, parse, cache=None, concurrency=8, fetcher=None,
+                       pages_per_chunk=None, executor=None, store=None, config=None):
+    """Fetch and extract many documents concurrently, yielding results as each one completes.
+
+    sources is an iterable of (name, content_bytes) pairs; content_bytes=None means
+    name is a URL to fetch with `fetcher` (a url_fetcher.UrlFetcher) or a local file
+    path, read only when its turn comes. At most
+    `concurrency` documents are fetched/extracted at once; model calls go out at
+    batch priority so interactive requests overtake them. Yields
+    (name, extracted dict, error message or None).
+    """
+    fetcher = fetcher or UrlFetcher()
+    semaphore = asyncio.Semaphore(concurrency)
+    async with fetcher.async_client(max_connections=concurrency) as http_client:
+
+        async def run(name, content_bytes):
+            async with semaphore:
+                try:
+                    if content_bytes is None and is_url(name):
+                        content_bytes = (await fetcher.fetch_async(http_client, name)).content
+                    elif content_bytes is None:
+                        content_bytes = await asyncio.to_thread(pathlib.Path(name).read_bytes)
+                    data = await extract_document(gateway, prompt, model, content_bytes, parse, cache,
+                                                  pages_per_chunk=pages_per_chunk, priority=BATCH,
+                                                  executor=executor, store=store, source=name,
+                                                  config=config)
+                    return name, data, None if data else "No data was extracted."
+                except Exception as e:
+                    return name, {}, str(e)
+
+        tasks = [asyncio.create_task(run(name, content_bytes)) for name, content_bytes in sources]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
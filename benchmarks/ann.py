@@ -0,0 +1,142 @@
+"""Approximate (IVF) versus exact drug similarity search: recall@k, QPS and build/load time.
+
+    python benchmarks/ann.py --drugs 100000 1000000 --nprobe 1 4 16 64 --out ann.json
+    python benchmarks/ann.py --artifact artifacts/<version>        # embeddings of a trained model
+
+Synthetic embeddings are drawn around --clusters random centers (latent vectors of
+real catalogs are clustered too; uniform noise is the worst case for IVF). The
+exact ranking is similarity_index.SimilarityIndex without a neighbor table. QPS is
+reported for batched queries (query_batch) and one query at a time (query).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex  # noqa: E402
+from similarity_index import SimilarityIndex, recall_at_k  # noqa: E402
+
+
+def make_embeddings(num_drugs, dim, num_clusters, noise=0.5, seed=0, chunk_rows=65536):
+    """Random clustered latent vectors (float32) and string drug IDs."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dim)).astype(np.float32)
+    latent = np.empty((num_drugs, dim), dtype=np.float32)
+    for start in range(0, num_drugs, chunk_rows):
+        rows = min(chunk_rows, num_drugs - start)
+        latent[start:start + rows] = centers[rng.integers(0, num_clusters, rows)] \
+            + noise * rng.normal(size=(rows, dim)).astype(np.float32)
+    return np.array([str(1000000 + i) for i in range(num_drugs)]), latent
+
+
+def timed_queries(index, queries, k, single_queries, **options):
+    """(BatchResult, batch QPS, one-at-a-time QPS)."""
+    start = time.perf_counter()
+    result = index.query_batch(queries, k, **options)
+    batch_qps = len(queries) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for drug_id in queries[:single_queries]:
+        index.query(drug_id, k, **options)
+    single_qps = min(single_queries, len(queries)) / (time.perf_counter() - start)
+    return result, batch_qps, single_qps
+
+
+def run(drug_ids, latent, args):
+    rng = np.random.default_rng(args.seed)
+    queries = drug_ids[rng.choice(len(drug_ids), size=min(args.queries, len(drug_ids)), replace=False)]
+    result = {"drugs": len(drug_ids), "dim": int(latent.shape[1]), "k": args.k, "queries": len(queries)}
+
+    exact = SimilarityIndex(drug_ids, latent)
+    reference, batch_qps, single_qps = timed_queries(exact, queries, args.k, args.single_queries)
+    result["exact"] = {"batch_qps": batch_qps, "single_qps": single_qps, "vector_bytes": exact.nbytes}
+    del exact
+
+    start = time.perf_counter()
+    index = IVFIndex.build(drug_ids, latent, args.num_lists, storage=args.storage, seed=args.seed)
+    result["build_seconds"] = time.perf_counter() - start
+    result["num_lists"] = index.num_lists
+    with tempfile.TemporaryDirectory() as directory:
+        index.save(directory)
+        del index
+        start = time.perf_counter()
+        index = IVFIndex.load(directory)
+        result["load_seconds"] = time.perf_counter() - start
+        result["index_bytes"] = index.nbytes
+
+        result["ivf"] = []
+        for nprobe in args.nprobe:
+            if nprobe > index.num_lists:
+                continue
+            approx, batch_qps, single_qps = timed_queries(index, queries, args.k, args.single_queries,
+                                                          nprobe=nprobe)
+            result["ivf"].append({
+                "nprobe": nprobe,
+                f"recall@{args.k}": recall_at_k(approx.neighbor_ids, reference.neighbor_ids),
+                "batch_qps": batch_qps,
+                "single_qps": single_qps,
+                "batch_speedup": batch_qps / result["exact"]["batch_qps"],
+                "single_speedup": single_qps / result["exact"]["single_qps"],
+            })
+        if args.target_recall:
+            start = time.perf_counter()
+            result["tuned_nprobe"] = index.nprobe_for_recall(args.target_recall, args.k)
+            result["tune_seconds"] = time.perf_counter() - start
+        del index
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--drugs", type=int, nargs="+", default=[100000], help="synthetic catalog sizes, one run each")
+    parser.add_argument("--artifact", help="saved artifact directory: use its latent.npy and drug_ids.npy instead")
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--clusters", type=int, default=1000, help="centers of the synthetic embeddings")
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--num-lists", type=int, help="IVF lists (default: about 4 * sqrt(drugs))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--storage", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--target-recall", type=float, default=0.95, help="also report nprobe_for_recall (0 skips)")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--single-queries", type=int, default=200, help="queries timed one at a time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    report = {"benchmark": "ann", "python": platform.python_version(), "machine": platform.machine(),
+              "cpus": os.cpu_count(), "config": vars(args), "runs": []}
+    if args.artifact:
+        datasets = [lambda: (np.load(os.path.join(args.artifact, "drug_ids.npy")),
+                             np.load(os.path.join(args.artifact, "latent.npy"), mmap_mode="r"))]
+    else:
+        datasets = [lambda drugs=drugs: make_embeddings(drugs, args.dim, args.clusters, args.noise, args.seed)
+                    for drugs in args.drugs]
+    for load in datasets:
+        drug_ids, latent = load()
+        run_result = run(drug_ids, latent, args)
+        report["runs"].append(run_result)
+        exact = run_result["exact"]
+        print(f"{run_result['drugs']} drugs: exact {exact['batch_qps']:.0f} q/s batch, "
+              f"{exact['single_qps']:.0f} q/s single; IVF build {run_result['build_seconds']:.1f}s "
+              f"({run_result['num_lists']} lists)", file=sys.stderr)
+        for ivf in run_result["ivf"]:
+            print(f"  nprobe {ivf['nprobe']:>4}: recall@{args.k} {ivf[f'recall@{args.k}']:.3f}, "
+                  f"{ivf['batch_qps']:.0f} q/s batch ({ivf['batch_speedup']:.1f}x), "
+                  f"{ivf['single_qps']:.0f} q/s single ({ivf['single_speedup']:.1f}x)", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Offline extraction throughput: local HTTP server + GenAI stub, no network or API key needed.
+
+    python benchmarks/extraction.py --documents 50 --pages 30 --latency 0.2 --concurrency 8 --out extraction.json
+
+Measures the app's single-document path (fetch -> extract -> parse, one at a time),
+the batch path (extract_many at --concurrency) and response parsing on its own.
+--latency is the simulated model response time per call.
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_extraction import extract_document, extract_many  # noqa: E402
+from chunked_extraction import MERGE_RULES  # noqa: E402
+from extraction import (DEFAULT_MODEL, EXTRACTION_PROMPT, StreamingExtractionParser,  # noqa: E402
+                        extraction_config, parse_extraction)
+from genai_gateway import GenAIGateway  # noqa: E402
+from url_fetcher import UrlFetcher  # noqa: E402
+
+STUB_RECORD = {field: "Not stated" for field in MERGE_RULES}
+STUB_RECORD.update({"Variant": "rs113993960", "Genes": "CFTR", "Drugs": "ivacaftor / lumacaftor",
+                    "Literature": "PMID:34511391"})
+
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubGenAIClient:
+    """Stands in for genai.Client: answers every generate_content after `latency` seconds.
+
+    Responses are plain JSON, as in the model's JSON output mode.
+    """
+
+    def __init__(self, latency=0.2, record=None):
+        self.latency = latency
+        self.text = json.dumps(record or STUB_RECORD)
+        self.calls = 0
+        stub = self
+
+        class Models:
+            def generate_content(self, model, contents, config=None):
+                stub.calls += 1
+                time.sleep(stub.latency)
+                return _StubResponse(stub.text)
+
+        class AsyncModels:
+            async def generate_content(self, model, contents, config=None):
+                stub.calls += 1
+                await asyncio.sleep(stub.latency)
+                return _StubResponse(stub.text)
+
+            async def generate_content_stream(self, model, contents, config=None):
+                stub.calls += 1
+
+                async def chunks():
+                    # First chunk after half the latency, the rest spread over the other half
+                    pieces = [stub.text[i:i + 64] for i in range(0, len(stub.text), 64)]
+                    await asyncio.sleep(stub.latency / 2)
+                    for piece in pieces:
+                        yield _StubResponse(piece)
+                        await asyncio.sleep(stub.latency / 2 / len(pieces))
+
+                return chunks()
+
+        self.models = Models()
+        self.aio = type("Aio", (), {"models": AsyncModels()})()
+
+
+def make_pdfs(directory, count, pages, padding_kb=0):
+    from pypdf import PdfWriter
+    names = []
+    for i in range(count):
+        writer = PdfWriter()
+        # A page size unique to each document keeps page chunks from being de-duplicated
+        for _ in range(pages):
+            writer.add_blank_page(612 + i, 792)
+        writer.add_metadata({"/Title": f"Benchmark document {i}", "/Padding": "x" * (padding_kb * 1024)})
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        name = f"doc{i:05d}.pdf"
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(buffer.getvalue())
+        names.append(name)
+    return names
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory):
+    """Serve `directory` on a free localhost port from a background thread; returns (server, base_url)."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_sequential(urls, gateway, fetcher, pages_per_chunk):
+    """The app's path: streamed responses, with the time until the first fields can be shown."""
+    fetch_times, extract_times, first_fields_times = [], [], []
+    start = time.perf_counter()
+    for url in urls:
+        fetch_start = time.perf_counter()
+        content = fetcher.fetch(url).content
+        extract_start = time.perf_counter()
+        first_fields = []
+
+        def on_partial(partial):
+            if not first_fields:
+                first_fields.append(time.perf_counter() - extract_start)
+
+        asyncio.run(extract_document(gateway, EXTRACTION_PROMPT, DEFAULT_MODEL, content, parse_extraction,
+                                     pages_per_chunk=pages_per_chunk, config=extraction_config(),
+                                     on_partial=on_partial))
+        fetch_times.append(extract_start - fetch_start)
+        extract_times.append(time.perf_counter() - extract_start)
+        first_fields_times.extend(first_fields)
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "docs_per_sec": len(urls) / elapsed,
+            "fetch_mean_ms": 1000 * sum(fetch_times) / len(urls),
+            "first_fields_mean_ms": 1000 * sum(first_fields_times) / max(len(first_fields_times), 1),
+            "extract_mean_ms": 1000 * sum(extract_times) / len(urls)}
+
+
+def run_batch(urls, gateway, fetcher, concurrency, pages_per_chunk):
+    async def consume():
+        failures = 0
+        async for _, _, error in extract_many([(url, None) for url in urls], gateway, EXTRACTION_PROMPT,
+                                              DEFAULT_MODEL, parse_extraction, concurrency=concurrency,
+                                              fetcher=fetcher, pages_per_chunk=pages_per_chunk,
+                                              config=extraction_config()):
+            failures += error is not None
+        return failures
+
+    start = time.perf_counter()
+    failures = asyncio.run(consume())
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "docs_per_sec": len(urls) / elapsed, "failures": failures,
+            "concurrency": concurrency}
+
+
+def run_parse(text, repeat):
+    """Mean parse time for JSON-mode output, drifted output (fenced, wrapped, cut off) and a 64-char stream."""
+    def mean_us(function):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return 1e6 * (time.perf_counter() - start) / repeat
+
+    def stream():
+        parser = StreamingExtractionParser()
+        for i in range(0, len(text), 64):
+            parser.feed(text[i:i + 64])
+
+    return {"calls": repeat,
+            "json_us": mean_us(lambda: parse_extraction(text)),
+            "fenced_us": mean_us(lambda: parse_extraction(f"Here you go:\n```json\n{text}\n```\nDone.")),
+            "truncated_us": mean_us(lambda: parse_extraction(text[:len(text) * 2 // 3])),
+            "stream_us": mean_us(stream)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=10, help="pages per sample PDF")
+    parser.add_argument("--padding-kb", type=int, default=200, help="extra bytes per PDF, to mimic real sizes")
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per model call")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--pages-per-chunk", type=int, default=20)
+    parser.add_argument("--parse-repeat", type=int, default=10000)
+    parser.add_argument("--out", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    report = {"benchmark": "extraction", "python": platform.python_version(), "cpus": os.cpu_count(),
+              "config": vars(args), "batch": []}
+    with tempfile.TemporaryDirectory() as directory:
+        names = make_pdfs(directory, args.documents, args.pages, args.padding_kb)
+        server, base_url = serve(directory)
+        urls = [f"{base_url}/{name}" for name in names]
+        try:
+            stub = StubGenAIClient(args.latency)
+            # Rate limiting is disabled here: the point is the app's own overhead
+            gateway = GenAIGateway(stub, requests_per_minute=10 ** 9, burst=10 ** 6)
+
+            with tempfile.TemporaryDirectory() as cache_dir:
+                report["sequential"] = run_sequential(urls, gateway, UrlFetcher(cache_dir), args.pages_per_chunk)
+            print(f"sequential: {report['sequential']['docs_per_sec']:.2f} docs/s", file=sys.stderr)
+            for concurrency in args.concurrency:
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    run = run_batch(urls, gateway, UrlFetcher(cache_dir), concurrency, args.pages_per_chunk)
+                report["batch"].append(run)
+                print(f"batch x{concurrency}: {run['docs_per_sec']:.2f} docs/s", file=sys.stderr)
+            report["parse"] = run_parse(stub.text, args.parse_repeat)
+            report["model_calls"] = stub.calls
+            report["gateway"] = gateway.stats()
+        finally:
+            server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
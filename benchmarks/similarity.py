@@ -0,0 +1,148 @@
+"""Drug similarity benchmark on synthetic ratings: per-stage timings, query latency, peak memory.
+
+    python benchmarks/similarity.py --drugs 2000 10000 --density 0.01 --format npz --out similarity.json
+
+Every (drugs, density, format) configuration runs in its own process, so the
+reported peak RSS belongs to that configuration alone. Stages mirror
+train_autoencoder: load, scale, train, encode and cosine (top-k neighbor table).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FORMATS = ("csv", "npy", "npz")
+
+
+def make_ratings(path, num_drugs, density, fmt="npz", num_columns=None, seed=0):
+    """Write a random drugs x drugs (or x num_columns) ratings matrix with 1-5 ratings at `density`."""
+    import pandas as pd
+    import scipy.sparse as sp
+    from ratings_io import save_dense_ratings, save_sparse_ratings
+
+    rng = np.random.default_rng(seed)
+    num_columns = num_columns or num_drugs
+    matrix = sp.random(num_drugs, num_columns, density=density, format="csr", dtype=np.float32, random_state=rng,
+                       data_rvs=lambda n: rng.integers(1, 6, n).astype(np.float32))
+    drug_ids = np.array([str(1000000 + i) for i in range(num_drugs)])
+    columns = drug_ids if num_columns == num_drugs else np.array([str(2000000 + i) for i in range(num_columns)])
+    if fmt == "npz":
+        save_sparse_ratings(matrix, drug_ids, columns, path)
+    elif fmt == "npy":
+        save_dense_ratings(matrix.toarray(), drug_ids, columns, path)
+    else:
+        pd.DataFrame(matrix.toarray(), index=drug_ids, columns=columns).to_csv(path)
+    return path
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_summary(samples):
+    samples = np.asarray(samples) * 1000
+    return {"mean_ms": float(samples.mean()), "p50_ms": float(np.percentile(samples, 50)),
+            "p95_ms": float(np.percentile(samples, 95)), "max_ms": float(samples.max())}
+
+
+def run_config(config):
+    """Benchmark one configuration; runs in a fresh process."""
+    import torch
+    from drug_discovery import DrugAutoencoder, as_training_input, encode, get_similar_drugs_autoencoder, train_model
+    from ratings_io import load_ratings_matrix, scale_ratings
+    from similarity_index import SimilarityIndex
+
+    result = {"config": config, "stages": {}, "peak_rss_mb": {"imports": peak_rss_mb()}}
+    torch.manual_seed(config["seed"])
+
+    def stage(name, function):
+        start = time.perf_counter()
+        value = function()
+        result["stages"][name] = time.perf_counter() - start
+        result["peak_rss_mb"][name] = peak_rss_mb()
+        return value
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"ratings.{config['format']}")
+        make_ratings(path, config["drugs"], config["density"], config["format"], config["columns"], config["seed"])
+        result["file_mb"] = os.path.getsize(path) / 1e6
+        result["peak_rss_mb"]["generate"] = peak_rss_mb()
+
+        raw, drug_ids, _ = stage("load", lambda: load_ratings_matrix(path))
+        ratings = stage("scale", lambda: as_training_input(scale_ratings(raw)[0]))
+        model = DrugAutoencoder(ratings.shape[1], latent_dim=config["latent_dim"])
+        history = stage("train", lambda: train_model(model, ratings, num_epochs=config["epochs"],
+                                                     patience=config["epochs"], log_every=10 ** 9))
+        latent = stage("encode", lambda: encode(model, ratings))
+        index = stage("cosine", lambda: SimilarityIndex(drug_ids, latent, precompute_k=config["k"]))
+        result["stages"]["total"] = sum(result["stages"].values())
+        result["epochs_run"] = len(history)
+
+    rng = np.random.default_rng(config["seed"])
+    queries = rng.choice(drug_ids, size=config["queries"])
+    # Precomputed table lookups (k <= table size) and on-demand scans (k above it)
+    for name, k in (("query_table", config["k"]), ("query_scan", config["k"] + 1)):
+        samples = []
+        for drug_id in queries:
+            start = time.perf_counter()
+            get_similar_drugs_autoencoder(drug_id, index, top_n=k)
+            samples.append(time.perf_counter() - start)
+        result[name] = latency_summary(samples)
+    start = time.perf_counter()
+    index.query_batch(queries, config["k"] + 1)
+    result["query_batch_qps"] = len(queries) / (time.perf_counter() - start)
+    result["peak_rss_mb"]["query"] = peak_rss_mb()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--drugs", type=int, nargs="+", default=[1000, 5000], help="matrix rows, one run each")
+    parser.add_argument("--columns", type=int, help="matrix columns (default: same as drugs)")
+    parser.add_argument("--density", type=float, nargs="+", default=[0.01], help="fraction of non-zero ratings")
+    parser.add_argument("--format", nargs="+", default=["npz"], choices=FORMATS)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--latent-dim", type=int, default=64)
+    parser.add_argument("-k", type=int, default=10, help="neighbors precomputed per drug")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    report = {"benchmark": "similarity", "python": platform.python_version(), "machine": platform.machine(),
+              "cpus": os.cpu_count(), "runs": []}
+    context = multiprocessing.get_context("spawn")
+    for fmt in args.format:
+        for drugs in args.drugs:
+            for density in args.density:
+                config = {"drugs": drugs, "columns": args.columns, "density": density, "format": fmt,
+                          "epochs": args.epochs, "latent_dim": args.latent_dim, "k": args.k,
+                          "queries": args.queries, "seed": args.seed}
+                with context.Pool(1) as pool:
+                    run = pool.apply(run_config, (config,))
+                report["runs"].append(run)
+                stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in run["stages"].items())
+                print(f"{fmt} {drugs} drugs @ {density}: {stages}; query p50 {run['query_table']['p50_ms']:.3f} ms "
+                      f"(table) / {run['query_scan']['p50_ms']:.3f} ms (scan); "
+                      f"peak {max(run['peak_rss_mb'].values()):.0f} MB", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Startup cost of the Streamlit app: per-module import time and cold/warm script runs.
+
+    python benchmarks/startup.py [--app app.py] [--repeat 5] [--out startup.json]
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+"cold_run" is the first run of the app script (what a new pod or worker pays),
+"rerun" a second run in the same process (what every widget interaction pays).
+Run it against an older checkout's app.py to compare before/after.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules app.py needed at import time at some point, cheapest first
+MODULES = ["numpy", "pandas", "streamlit", "httpx", "google.genai", "sklearn.preprocessing", "torch", "drug_discovery"]
+
+IMPORT_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+APP_SNIPPET = """
+import os, sys, time, json
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=600)
+start = time.perf_counter()
+at.run()
+cold = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start
+heavy = sorted(m for m in ("torch", "sklearn", "google.genai", "drug_discovery") if m in sys.modules)
+print(json.dumps({{"cold_run": cold, "rerun": rerun, "heavy_modules_loaded": heavy,
+                   "exceptions": [str(e.value) for e in at.exception]}}))
+"""
+
+
+def run_snippet(code, cwd):
+    env = dict(os.environ, GENAI_KEY=os.environ.get("GENAI_KEY", "benchmark"), PYTHONPATH=cwd)
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def summarize(samples):
+    return {"median_s": statistics.median(samples), "min_s": min(samples), "max_s": max(samples)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    app = os.path.abspath(args.app)
+    cwd = os.path.dirname(app)
+    report = {"app": app, "python": sys.version.split()[0], "repeat": args.repeat, "imports": {}}
+    for module in MODULES:
+        samples = [float(run_snippet(IMPORT_SNIPPET.format(module=module), cwd)) for _ in range(args.repeat)]
+        report["imports"][module] = summarize(samples)
+        print(f"import {module}: {report['imports'][module]['median_s'] * 1000:.0f} ms", file=sys.stderr)
+
+    runs = [json.loads(run_snippet(APP_SNIPPET.format(app=app), cwd)) for _ in range(args.repeat)]
+    report["cold_run"] = summarize([run["cold_run"] for run in runs])
+    report["rerun"] = summarize([run["rerun"] for run in runs])
+    report["heavy_modules_loaded"] = runs[0]["heavy_modules_loaded"]
+    report["exceptions"] = runs[0]["exceptions"]
+    print(f"cold run: {report['cold_run']['median_s'] * 1000:.0f} ms, rerun: {report['rerun']['median_s'] * 1000:.0f} ms, "
+          f"heavy modules loaded: {report['heavy_modules_loaded'] or 'none'}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
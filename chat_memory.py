@@ -0,0 +1,83 @@
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for budgeting prompts
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and a pharmaceutical expert. "
+    "Keep drug names, conditions, doses and any facts the user stated about themselves. "
+    "Answer with the updated summary only, in at most {max_words} words.\n\n"
+    "Current summary:\n{summary}\n\nNew messages:\n{messages}\n\nUpdated summary:"
+)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_messages(messages):
+    return "\n".join(f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages)
+
+
+class ChatMemory:
+    """Multi-turn chat context under a token budget, with a hard per-session memory cap.
+
+    Recent turns are sent verbatim while they fit in window_tokens; older turns are
+    folded into a rolling summary (at most summary_tokens). Stored messages, kept for
+    display, are capped by count and total characters, dropping the oldest first.
+    """
+
+    def __init__(self, window_tokens=1500, summary_tokens=300, max_messages=200, max_chars=200_000):
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.summary = ""
+        self.messages = []
+        # messages[window_start:] are sent verbatim; everything before is in the summary
+        self.window_start = 0
+
+    def add(self, role, content):
+        self.messages.append({"role": role, "content": content})
+
+    def window(self):
+        return self.messages[self.window_start:]
+
+    def build_prompt(self, instruction, question):
+        """Prompt with the rolling summary, the recent turns and the new question."""
+        parts = [instruction]
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+        if self.window():
+            parts.append(f"Recent conversation:\n{format_messages(self.window())}")
+        parts.append(f"Question: {question}\nAnswer:")
+        return "\n\n".join(parts)
+
+    def compact(self, summarize):
+        """Fold the oldest window turns into the summary until the window fits its budget.
+
+        summarize(prompt) -> str is the model call; if it fails the summary falls back to
+        a truncated transcript so the budget still holds.
+        """
+        window = self.window()
+        tokens = sum(estimate_tokens(m["content"]) for m in window)
+        folded = []
+        # Always keep the latest exchange verbatim
+        while tokens > self.window_tokens and len(window) - len(folded) > 2:
+            folded.append(window[len(folded)])
+            tokens -= estimate_tokens(folded[-1]["content"])
+        if folded:
+            max_words = self.summary_tokens * 3 // 4
+            prompt = SUMMARY_PROMPT.format(max_words=max_words, summary=self.summary or "(none)",
+                                           messages=format_messages(folded))
+            try:
+                summary = summarize(prompt).strip()
+            except Exception:
+                summary = f"{self.summary}\n{format_messages(folded)}".strip()
+            # Hard bound on the summary size, whatever the model returned
+            self.summary = summary[-self.summary_tokens * CHARS_PER_TOKEN:]
+            self.window_start += len(folded)
+        self._enforce_cap()
+
+    def _enforce_cap(self):
+        total_chars = sum(len(m["content"]) for m in self.messages)
+        while self.messages and (len(self.messages) > self.max_messages or total_chars > self.max_chars):
+            total_chars -= len(self.messages.pop(0)["content"])
+            self.window_start = max(self.window_start - 1, 0)
@@ -0,0 +1,139 @@
+import io
+import re
+
+NOT_STATED = "Not stated"
+
+# How each prompt field is merged across page chunks (chunks are visited in page order):
+#   union  - distinct comma/semicolon separated values, in order of first appearance
+#   concat - distinct statements joined with "; "
+#   first  - first chunk that states a value (e.g. the paper's own PMID/DOI on its first pages)
+#   min    - smallest numeric value (most significant p-value), else first stated
+#   max    - largest numeric value (full cohort size rather than a subgroup), else first stated
+#            (min/max fall back to first stated when any value is not a number we can read)
+MERGE_RULES = {
+    "Variant": "union",
+    "Genes": "union",
+    "Drugs": "union",
+    "Association": "concat",
+    "Significance": "first",
+    "P-Value": "min",
+    "Number of Cases": "max",
+    "Number of Controls": "max",
+    "Biogeographical Groups": "union",
+    "Phenotype Categories": "union",
+    "Pediatric": "concat",
+    "More Details": "concat",
+    "Literature": "first",
+}
+
+_NUMBER = re.compile(r"[-+]?\d[\d,]*\.?\d*(?:[eE][-+]?\d+)?")
+# a x 10^-b, 10^-b and the like, after _normalize_number_text
+_POWER_OF_TEN = re.compile(r"(\d+(?:\.\d+)?)\s*[x*]\s*10\s*\^?\s*([-+]?\d+)|(?<![\d.])10\s*\^\s*([-+]?\d+)")
+_SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻", "0123456789+-")
+
+
+def split_pdf(content_bytes, pages_per_chunk=20):
+    """Split a PDF into (first_page, last_page, pdf_bytes) chunks of at most pages_per_chunk pages.
+
+    Returns the whole document as a single chunk when it is short, unreadable, or
+    pypdf is not installed.
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+        reader = PdfReader(io.BytesIO(content_bytes))
+        num_pages = len(reader.pages)
+    except Exception:
+        return [(1, None, content_bytes)]
+    if num_pages <= pages_per_chunk:
+        return [(1, num_pages, content_bytes)]
+
+    chunks = []
+    for start in range(0, num_pages, pages_per_chunk):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + pages_per_chunk]:
+            writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        chunks.append((start + 1, min(start + pages_per_chunk, num_pages), buffer.getvalue()))
+    return chunks
+
+
+def chunk_prompt(prompt, first_page, last_page, num_pages):
+    return (f"{prompt}\nThis is pages {first_page}-{last_page} of a {num_pages}-page document. "
+            "Only report information that appears in these pages.")
+
+
+def _text(value):
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item).strip() for item in value)
+    return str(value).strip()
+
+
+def is_stated(value):
+    if value is None:
+        return False
+    text = _text(value)
+    return bool(text) and text.lower() not in {"not stated", "unknown", "n/a", "none"}
+
+
+def _normalize_number_text(text):
+    """Plain ASCII for the usual ways papers write numbers: −/– minus, ×/· times, superscripts."""
+    text = text.replace("−", "-").replace("–", "-").replace("×", "x").replace("·", "*")
+    text = re.sub(r"\s*x\s*10\s*(?=[⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻])", " x 10^", text)
+    text = re.sub(r"(?<![\d.])10(?=[⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻])", "10^", text)
+    return text.translate(_SUPERSCRIPTS).replace("E", "e")
+
+
+def _as_number(value):
+    """The number in a value (1.2 x 10^-8 style included), or None if it cannot be read reliably."""
+    text = _normalize_number_text(str(value))
+    powers = list(_POWER_OF_TEN.finditer(text))
+    rest = _POWER_OF_TEN.sub(" ", text)
+    plain = _NUMBER.findall(rest)
+    if len(powers) + len(plain) != 1 or re.search(r"[x*]\s*10|\^", rest):
+        # No number, several numbers, or a power we could not parse: picking by one of them would be wrong
+        return None
+    if powers:
+        power = powers[0]
+        return float(f"{power.group(1)}e{power.group(2)}") if power.group(1) else float(f"1e{power.group(3)}")
+    try:
+        return float(plain[0].replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _merge_field(rule, values):
+    values = [_text(value) for value in values if is_stated(value)]
+    if not values:
+        return NOT_STATED
+    if rule in ("min", "max"):
+        numeric = [(_as_number(value), value) for value in values]
+        if all(number is not None for number, _ in numeric):
+            pick = min if rule == "min" else max
+            # Ties keep the earliest chunk's wording
+            return pick(numeric, key=lambda pair: pair[0])[1]
+        return values[0]
+    if rule == "first":
+        return values[0]
+
+    seen, merged = set(), []
+    parts = (part.strip() for value in values for part in re.split(r"[;,]", value)) if rule == "union" else values
+    for part in parts:
+        if part and part.lower() not in seen:
+            seen.add(part.lower())
+            merged.append(part)
+    return ", ".join(merged) if rule == "union" else "; ".join(merged)
+
+
+def merge_extractions(chunk_results):
+    """Merge per-chunk extraction dicts (in page order) into one record of the prompt's fields."""
+    merged = {
+        field: _merge_field(rule, [result.get(field) for result in chunk_results])
+        for field, rule in MERGE_RULES.items()
+    }
+    # Keep any extra keys the model returned, from the first chunk that has them
+    for result in chunk_results:
+        for field, value in result.items():
+            if field not in merged and is_stated(value):
+                merged[field] = value
+    return merged
@@ -1,93 +1,558 @@
+import copy
+import hashlib
+import json
+import os
+import time
+
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 import torch
 import torch.nn as nn
 import torch.optim as optim
+from torch.utils.data import DataLoader, TensorDataset
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics.pairwise import cosine_similarity
 
-def train_autoencoder(ratings_file="./ratings_mat.csv"):
+import metrics
+from ratings_io import (
+    BINARY_FORMATS, apply_scaler, carry_over_scaler, fit_scaler, ids_path, load_ratings_matrix,
+    row_signatures, scale_ratings,
+)
+from ann_index import DEFAULT_NPROBE, IVFIndex
+from similarity_index import SimilarityIndex, storage_report
+
+DEFAULT_RATINGS_FILE = "./ratings_mat.csv"
+DEFAULT_ARTIFACT_DIR = "./artifacts"
+
+
+class SparseInputLinear(nn.Linear):
+    """nn.Linear that also accepts a torch.sparse input batch (same parameters and state_dict)."""
+
+    def forward(self, x):
+        if x.is_sparse:
+            return torch.sparse.addmm(self.bias, x, self.weight.t())
+        return super().forward(x)
+
+
+# Define Autoencoder Model
+class DrugAutoencoder(nn.Module):
+    def __init__(self, input_dim, latent_dim=64):
+        super(DrugAutoencoder, self).__init__()
+        self.encoder = nn.Sequential(
+            SparseInputLinear(input_dim, 128),
+            nn.ReLU(),
+            nn.Linear(128, latent_dim)  # Bottleneck layer
+        )
+        self.decoder = nn.Sequential(
+            nn.Linear(latent_dim, 128),
+            nn.ReLU(),
+            nn.Linear(128, input_dim)
+        )
+
+    def forward(self, x):
+        encoded = self.encoder(x)
+        decoded = self.decoder(encoded)
+        return encoded, decoded
+
+
+def ratings_file_hash(ratings_file=DEFAULT_RATINGS_FILE):
+    """Short content hash of the ratings file, used to version model artifacts."""
+    digest = hashlib.sha256()
+    paths = [ratings_file]
+    if ratings_file.endswith(BINARY_FORMATS):
+        # Binary layouts keep their drug IDs in a separate table, which is part of the version
+        paths.append(ids_path(ratings_file))
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def rows_to_tensors(matrix, rows):
+    """(encoder input, dense reconstruction target) for a batch of row indices.
+
+    Sparse matrices are fed to the encoder as torch.sparse tensors, so only the
+    current batch is ever densified (for the reconstruction loss).
+    """
+    if sp.issparse(matrix):
+        block = matrix[np.asarray(rows)].tocoo()
+        indices = torch.from_numpy(np.vstack([block.row, block.col]).astype(np.int64))
+        values = torch.from_numpy(block.data.astype(np.float32))
+        sparse_batch = torch.sparse_coo_tensor(indices, values, block.shape, check_invariants=False).coalesce()
+        return sparse_batch, torch.from_numpy(block.toarray())
+    if isinstance(matrix, torch.Tensor):
+        batch = matrix[rows]
+    else:
+        # Memory-mapped (ScaledMatrix) input: read and scale only this batch
+        batch = torch.from_numpy(matrix[np.asarray(rows)])
+    return batch, batch
+
+
+def set_torch_threads(num_threads=None, interop_threads=None):
+    """Pin intra-op / inter-op CPU thread pools (None leaves the torch default)."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            print("Inter-op thread count already fixed for this process; keeping it")
+
+
+def train_model(autoencoder, ratings, num_epochs=50, batch_size=256, lr=0.001,
+                shuffle=True, val_fraction=0.1, patience=5, min_delta=1e-5,
+                num_threads=None, interop_threads=None, seed=0, log_every=10):
+    """Mini-batch training with early stopping on validation reconstruction loss.
+
+    ratings is a dense float32 tensor or a scipy sparse matrix. Returns a per-epoch
+    history of losses, wall time and throughput. When a validation split is used, the
+    weights from the best validation epoch are restored at the end.
+    """
+    set_torch_threads(num_threads, interop_threads)
+    generator = torch.Generator().manual_seed(seed)
+
+    # Hold out a validation slice of drugs (skipped for tiny matrices)
+    num_rows = ratings.shape[0]
+    num_val = int(num_rows * val_fraction) if num_rows >= 20 else 0
+    permutation = torch.randperm(num_rows, generator=generator)
+    train_rows = permutation[num_val:]
+    val_rows = permutation[:num_val]
+
+    train_loader = DataLoader(TensorDataset(train_rows), batch_size=batch_size,
+                              shuffle=shuffle, generator=generator)
+    optimizer = optim.Adam(autoencoder.parameters(), lr=lr)
+    loss_function = nn.MSELoss()
+
+    history = []
+    best_loss, best_state, stale_epochs = float("inf"), None, 0
+    for epoch in range(num_epochs):
+        epoch_start = time.perf_counter()
+        autoencoder.train()
+        train_loss = 0.0
+        for (rows,) in train_loader:
+            batch, target = rows_to_tensors(ratings, rows)
+            optimizer.zero_grad()
+            encoded, decoded = autoencoder(batch)
+            loss = loss_function(decoded, target)
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.item() * len(rows)
+        train_loss /= len(train_rows)
+
+        val_loss = None
+        if num_val:
+            autoencoder.eval()
+            val_loss = 0.0
+            with torch.no_grad():
+                for start in range(0, num_val, batch_size):
+                    rows = val_rows[start:start + batch_size]
+                    batch, target = rows_to_tensors(ratings, rows)
+                    val_loss += loss_function(autoencoder(batch)[1], target).item() * len(rows)
+            val_loss /= num_val
+
+        elapsed = time.perf_counter() - epoch_start
+        history.append({
+            "epoch": epoch + 1,
+            "train_loss": train_loss,
+            "val_loss": val_loss,
+            "seconds": elapsed,
+            "rows_per_sec": len(train_rows) / elapsed if elapsed else float("inf"),
+        })
+        metrics.observe("train_epoch_seconds", elapsed)
+        if (epoch + 1) % log_every == 0:
+            val_msg = f", Val Loss: {val_loss:.4f}" if val_loss is not None else ""
+            print(f"Epoch [{epoch+1}/{num_epochs}], Loss: {train_loss:.4f}{val_msg}, "
+                  f"{elapsed:.2f}s ({history[-1]['rows_per_sec']:.0f} rows/s)")
+
+        if val_loss is None:
+            continue
+        if val_loss < best_loss - min_delta:
+            best_loss, stale_epochs = val_loss, 0
+            best_state = copy.deepcopy(autoencoder.state_dict())
+        else:
+            stale_epochs += 1
+            if stale_epochs >= patience:
+                print(f"Early stopping at epoch {epoch+1}, best Val Loss: {best_loss:.4f}")
+                break
+
+    if best_state is not None:
+        autoencoder.load_state_dict(best_state)
+    autoencoder.eval()
+    return history
+
+
+def encode(autoencoder, ratings, rows=None, batch_size=4096):
+    """Latent representations for the given rows (default all), encoded in batches to bound peak memory."""
+    autoencoder.eval()
+    rows = np.arange(ratings.shape[0]) if rows is None else np.asarray(rows)
+    latent = [torch.zeros((0, autoencoder.encoder[-1].out_features))]
+    with torch.no_grad():
+        for start in range(0, len(rows), batch_size):
+            batch, _ = rows_to_tensors(ratings, rows[start:start + batch_size])
+            latent.append(autoencoder.encoder(batch))
+    return torch.cat(latent).numpy()
+
+
+def as_training_input(scaled_matrix):
+    # Convert in-memory dense input to a PyTorch tensor
+    # (sparse and memory-mapped input is converted per batch)
+    if isinstance(scaled_matrix, np.ndarray):
+        return torch.from_numpy(scaled_matrix)
+    return scaled_matrix
+
+
+def take_rows(ratings, rows):
+    """A row subset in a form train_model accepts (small enough to hold in memory)."""
+    if sp.issparse(ratings) or isinstance(ratings, torch.Tensor):
+        return ratings[rows]
+    return torch.from_numpy(ratings[rows])
+
+
+def fit_autoencoder(ratings_file=DEFAULT_RATINGS_FILE, latent_dim=64, **train_options):
+    """Train the autoencoder and return everything needed to serve similarity queries.
+
+    train_options are passed to train_model (epochs, batch size, threads, early stopping).
+    """
     # Load datasets
     # ratings_file = "/content/drive/My Drive/Hacklytics/Datasets/ratings_mat.csv"
     # mappings_file = "/content/drive/My Drive/Hacklytics/Datasets/drug-mappings.tsv"
-
-    ratings_df = pd.read_csv(ratings_file, index_col=0)  # Drugs as rows & cols
+    # Dense CSV, memory-mapped .npy or a sparse layout (.npz / COO triples), see ratings_io
+    with metrics.span("train_stage", stage="load"):
+        raw_matrix, drug_ids, columns = load_ratings_matrix(ratings_file)
     # mappings_df = pd.read_csv(mappings_file, delimiter="\t")  # Drug mappings
 
-    # Ensure drug IDs are consistent (convert to string to avoid float IDs)
-    ratings_df.index = ratings_df.index.astype(str)
-    ratings_df.columns = ratings_df.columns.astype(str)
-
-    # Normalize data (scale to [0,1] range)
-    scaler = MinMaxScaler()
-    ratings_matrix = scaler.fit_transform(ratings_df.values)
-
-    # Define Autoencoder Model
-    class DrugAutoencoder(nn.Module):
-        def __init__(self, input_dim, latent_dim=64):
-            super(DrugAutoencoder, self).__init__()
-            self.encoder = nn.Sequential(
-                nn.Linear(input_dim, 128),
-                nn.ReLU(),
-                nn.Linear(128, latent_dim)  # Bottleneck layer
-            )
-            self.decoder = nn.Sequential(
-                nn.Linear(latent_dim, 128),
-                nn.ReLU(),
-                nn.Linear(128, input_dim)
-            )
-
-        def forward(self, x):
-            encoded = self.encoder(x)
-            decoded = self.decoder(encoded)
-            return encoded, decoded
-
-    # Convert to PyTorch tensor
-    ratings_tensor = torch.tensor(ratings_matrix, dtype=torch.float32)
+    # Normalize data (scale to [0,1] range); sparse input stays sparse
+    with metrics.span("train_stage", stage="scale"):
+        ratings_matrix, scaler = scale_ratings(raw_matrix)
+        ratings_matrix = as_training_input(ratings_matrix)
 
     # Model & Training Setup
     input_dim = ratings_matrix.shape[1]
-    autoencoder = DrugAutoencoder(input_dim, latent_dim=64)
-    optimizer = optim.Adam(autoencoder.parameters(), lr=0.001)
-    loss_function = nn.MSELoss()
+    autoencoder = DrugAutoencoder(input_dim, latent_dim=latent_dim)
 
     # Train Autoencoder
-    num_epochs = 50
-    for epoch in range(num_epochs):
-        optimizer.zero_grad()
-        encoded, decoded = autoencoder(ratings_tensor)
-        loss = loss_function(decoded, ratings_tensor)
-        loss.backward()
-        optimizer.step()
-
-        if (epoch + 1) % 10 == 0:
-            print(f"Epoch [{epoch+1}/{num_epochs}], Loss: {loss.item():.4f}")
+    with metrics.span("train_stage", stage="train"):
+        history = train_model(autoencoder, ratings_matrix, **train_options)
 
     # Extract Latent Representations
+    with metrics.span("train_stage", stage="encode"):
+        latent_embeddings = encode(autoencoder, ratings_matrix)
+
+    return {
+        "version": ratings_file_hash(ratings_file),
+        "model": autoencoder,
+        "scaler": scaler,
+        "drug_ids": drug_ids,
+        "columns": columns,
+        "latent": latent_embeddings,
+        "row_signatures": row_signatures(raw_matrix, columns),
+        "history": history,
+    }
+
+
+def warm_start_model(previous, columns, latent_dim=None):
+    """New autoencoder for `columns`, initialised from a previous artifact's weights.
+
+    Weights are matched by column ID, so added, removed or reordered columns are
+    handled. Encoder weights for new columns start at zero (rows without values
+    there encode exactly as before); their decoder outputs keep the default init.
+    """
+    old_model = previous["model"]
+    latent_dim = latent_dim or old_model.encoder[-1].out_features
+    model = DrugAutoencoder(len(columns), latent_dim=latent_dim)
+
+    old_positions = {column: i for i, column in enumerate(previous["columns"])}
+    new_idx = [j for j, column in enumerate(columns) if column in old_positions]
+    old_idx = [old_positions[columns[j]] for j in new_idx]
     with torch.no_grad():
-        latent_embeddings, _ = autoencoder(ratings_tensor)
+        model.encoder[0].weight.zero_()
+        model.encoder[0].weight[:, new_idx] = old_model.encoder[0].weight[:, old_idx]
+        model.encoder[0].bias.copy_(old_model.encoder[0].bias)
+        model.encoder[2].load_state_dict(old_model.encoder[2].state_dict())
+        model.decoder[0].load_state_dict(old_model.decoder[0].state_dict())
+        model.decoder[2].weight[new_idx] = old_model.decoder[2].weight[old_idx]
+        model.decoder[2].bias[new_idx] = old_model.decoder[2].bias[old_idx]
+    return model
+
+
+def update_artifact(previous, ratings_file=DEFAULT_RATINGS_FILE, replay_ratio=4, max_drift=0.05,
+                    num_epochs=5, lr=0.0005, seed=0, **train_options):
+    """Incrementally refresh a previous artifact for a changed ratings file.
+
+    Rows whose raw values changed (or that are new) are detected by row signature.
+    The model is warm-started from the previous weights and fine-tuned on those rows
+    plus a replay sample of unchanged rows, then only the affected rows are
+    re-encoded. If fine-tuning moved the embeddings of unchanged rows by more than
+    max_drift (mean relative L2 change on a sample), every row is re-encoded instead.
+    """
+    raw_matrix, drug_ids, columns = load_ratings_matrix(ratings_file)
+    signatures = row_signatures(raw_matrix, columns)
+
+    old_positions = {drug_id: i for i, drug_id in enumerate(previous["drug_ids"])}
+    old_rows = np.array([old_positions.get(drug_id, -1) for drug_id in drug_ids], dtype=np.int64)
+    previous_signatures = previous.get("row_signatures")
+    if previous_signatures is None:
+        changed = np.ones(len(drug_ids), dtype=bool)
+    else:
+        changed = (old_rows < 0) | (previous_signatures[old_rows] != signatures)
+    changed_rows = np.flatnonzero(changed)
+    stable_rows = np.flatnonzero(~changed)
+
+    # Keep the previous scaling for existing columns so unchanged rows scale identically
+    scaler = carry_over_scaler(previous["scaler"], previous["columns"], fit_scaler(raw_matrix), columns)
+    ratings_matrix = as_training_input(apply_scaler(raw_matrix, scaler))
+
+    autoencoder = warm_start_model(previous, columns)
+    rng = np.random.default_rng(seed)
+    replay = rng.choice(stable_rows, size=min(len(stable_rows), replay_ratio * len(changed_rows)), replace=False)
+    tune_rows = np.sort(np.concatenate([changed_rows, replay]))
+    history = []
+    if len(changed_rows):
+        history = train_model(autoencoder, take_rows(ratings_matrix, tune_rows), num_epochs=num_epochs,
+                              lr=lr, seed=seed, **train_options)
+
+    latent = np.empty((len(drug_ids), autoencoder.encoder[-1].out_features), dtype=np.float32)
+    latent[stable_rows] = previous["latent"][old_rows[stable_rows]]
+    drift = 0.0
+    if len(stable_rows):
+        sample = np.sort(rng.choice(stable_rows, size=min(len(stable_rows), 512), replace=False))
+        fresh = encode(autoencoder, ratings_matrix, sample)
+        before = latent[sample]
+        drift = float(np.mean(np.linalg.norm(fresh - before, axis=1) /
+                              np.maximum(np.linalg.norm(before, axis=1), 1e-12)))
+    if drift > max_drift:
+        print(f"Embedding drift {drift:.3f} > {max_drift}; re-encoding all {len(drug_ids)} drugs")
+        changed[:] = True
+        changed_rows = np.arange(len(drug_ids))
+    latent[changed_rows] = encode(autoencoder, ratings_matrix, changed_rows)
+    num_removed = len(previous["drug_ids"]) - int((old_rows >= 0).sum())
+    print(f"Incremental update: {len(changed_rows)} of {len(drug_ids)} drugs re-encoded, {num_removed} removed")
+
+    artifact = {
+        "version": ratings_file_hash(ratings_file),
+        "model": autoencoder,
+        "scaler": scaler,
+        "drug_ids": drug_ids,
+        "columns": columns,
+        "latent": latent,
+        "row_signatures": signatures,
+        "history": history,
+        "parent": previous["version"],
+    }
+    if previous.get("neighbors") is not None:
+        # Patch only the neighbor-table entries the changed rows can affect
+        index = build_similarity_index(previous).updated(drug_ids, latent, drug_ids[changed_rows])
+        artifact["neighbors"], artifact["neighbor_scores"] = index.neighbors, index.neighbor_scores
+    return artifact
+
+
+def _save_npy(path, array):
+    # Write then rename, so a process that memory-mapped the old file keeps a valid copy
+    tmp_path = path[:-len(".npy")] + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def save_artifact(artifact, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Write model weights, scaler parameters, drug IDs and embeddings under artifact_dir/<version>/."""
+    path = os.path.join(artifact_dir, artifact["version"])
+    os.makedirs(path, exist_ok=True)
+
+    model = artifact["model"]
+    scaler = artifact["scaler"]
+    torch.save(model.state_dict(), os.path.join(path, "model.pt"))
+    np.savez(
+        os.path.join(path, "scaler.npz"),
+        min_=scaler.min_,
+        scale_=scaler.scale_,
+        data_min_=scaler.data_min_,
+        data_max_=scaler.data_max_,
+        data_range_=scaler.data_range_,
+    )
+    for name in ("drug_ids", "columns", "latent", "row_signatures", "neighbors", "neighbor_scores"):
+        if artifact.get(name) is not None:
+            _save_npy(os.path.join(path, f"{name}.npy"), artifact[name])
+
+    meta = {
+        "version": artifact["version"],
+        "input_dim": int(model.encoder[0].in_features),
+        "latent_dim": int(model.encoder[-1].out_features),
+        "num_drugs": int(len(artifact["drug_ids"])),
+        "history": artifact.get("history", []),
+        "parent": artifact.get("parent"),
+    }
+    # meta.json is written last so a half-written directory is never treated as complete
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return path
+
+
+def load_artifact(version, artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Load a saved artifact, or return None if that version has not been trained yet."""
+    path = os.path.join(artifact_dir, version)
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
 
-    # Compute Cosine Similarities in Latent Space
-    latent_matrix = latent_embeddings.numpy()
-    cosine_sim_matrix = cosine_similarity(latent_matrix)
+    model = DrugAutoencoder(meta["input_dim"], latent_dim=meta["latent_dim"])
+    model.load_state_dict(torch.load(os.path.join(path, "model.pt"), map_location="cpu"))
+    model.eval()
+
+    scaler = MinMaxScaler()
+    with np.load(os.path.join(path, "scaler.npz")) as params:
+        for name in params.files:
+            setattr(scaler, name, params[name])
+    scaler.n_features_in_ = meta["input_dim"]
+
+    artifact = {
+        "version": meta["version"],
+        "model": model,
+        "scaler": scaler,
+        "drug_ids": np.load(os.path.join(path, "drug_ids.npy")),
+        "columns": np.load(os.path.join(path, "columns.npy")),
+        # Memory-mapped: processes share one page-cached copy, and compressed
+        # similarity storage only pages in the rows it re-ranks
+        "latent": np.load(os.path.join(path, "latent.npy"), mmap_mode="r"),
+        "history": meta.get("history", []),
+        "parent": meta.get("parent"),
+    }
+    for name in ("row_signatures", "neighbors", "neighbor_scores"):
+        file_path = os.path.join(path, f"{name}.npy")
+        artifact[name] = np.load(file_path) if os.path.exists(file_path) else None
+    return artifact
+
+
+def latest_artifact_version(artifact_dir=DEFAULT_ARTIFACT_DIR):
+    """Version of the most recently saved complete artifact, or None."""
+    if not os.path.isdir(artifact_dir):
+        return None
+    saved = [
+        (os.path.getmtime(os.path.join(artifact_dir, version, "meta.json")), version)
+        for version in os.listdir(artifact_dir)
+        if os.path.exists(os.path.join(artifact_dir, version, "meta.json"))
+    ]
+    return max(saved)[1] if saved else None
+
+
+def load_or_train(ratings_file=DEFAULT_RATINGS_FILE, artifact_dir=DEFAULT_ARTIFACT_DIR,
+                  incremental=True, precompute_k=0, **train_options):
+    """Return the artifact for the current ratings file, training only if its hash is new.
+
+    With incremental=True a new ratings file is handled by update_artifact on top of
+    the latest saved artifact instead of a full retrain. precompute_k > 0 stores a
+    top-k neighbor table with the artifact, so it is built (or patched) only once.
+    train_options go to fit_autoencoder, or to update_artifact's fine-tuning (except
+    latent_dim, which a warm-started model keeps).
+    """
+    version = ratings_file_hash(ratings_file)
+    artifact = load_artifact(version, artifact_dir)
+    needs_save = artifact is None
+    if artifact is None:
+        previous_version = latest_artifact_version(artifact_dir) if incremental else None
+        if previous_version is not None:
+            with metrics.span("train_stage", stage="incremental_update"):
+                update_options = {name: value for name, value in train_options.items() if name != "latent_dim"}
+                artifact = update_artifact(load_artifact(previous_version, artifact_dir), ratings_file,
+                                           **update_options)
+        else:
+            artifact = fit_autoencoder(ratings_file, **train_options)
+
+    neighbors = artifact.get("neighbors")
+    if precompute_k and (neighbors is None or neighbors.shape[1] < precompute_k):
+        build_similarity_index(artifact, precompute_k)
+        needs_save = True
+    if needs_save:
+        save_artifact(artifact, artifact_dir)
+    return artifact
+
+
+def build_similarity_index(artifact, precompute_k=0, storage="float32"):
+    # Cosine similarities in latent space are computed per query (or per row block
+    # when precompute_k is set) instead of as a dense N x N matrix.
+    # storage="float16"/"int8" compresses the vectors, see embedding_storage_report
+    index = SimilarityIndex(artifact["drug_ids"], artifact["latent"], storage=storage)
+    neighbors = artifact.get("neighbors")
+    if neighbors is not None and neighbors.shape[1] >= precompute_k:
+        return index.set_table(neighbors, artifact["neighbor_scores"])
+    if precompute_k:
+        with metrics.span("train_stage", stage="cosine"):
+            index.precompute(precompute_k)
+        # Keep the table with the artifact so save_artifact persists it
+        artifact["neighbors"], artifact["neighbor_scores"] = index.neighbors, index.neighbor_scores
+    return index
 
-    # Convert similarity matrix to DataFrame
-    cosine_sim_df = pd.DataFrame(cosine_sim_matrix, index=ratings_df.index, columns=ratings_df.index)
 
-    return cosine_sim_df
+def load_ann_index(artifact, artifact_dir=DEFAULT_ARTIFACT_DIR, num_lists=None, nprobe=DEFAULT_NPROBE,
+                   storage="float32"):
+    """Approximate (IVF) similarity index for catalogs too large for an exact scan or neighbor table.
+
+    Built once per artifact and storage type under artifact_dir/<version>/ivf-<storage>/
+    and memory-mapped from there afterwards; num_lists defaults to about 4 * sqrt(drugs).
+    """
+    path = os.path.join(artifact_dir, artifact["version"], f"ivf-{storage}")
+    index = IVFIndex.load(path, nprobe=nprobe)
+    if index is not None and (num_lists is None or index.num_lists == num_lists):
+        return index
+    with metrics.span("train_stage", stage="ann_build"):
+        index = IVFIndex.build(artifact["drug_ids"], artifact["latent"], num_lists, nprobe, storage)
+    index.save(path)
+    return IVFIndex.load(path, nprobe=nprobe)
+
+
+def embedding_storage_report(artifact, k=10, sample_size=1000):
+    """Memory, recall@k against exact search, and latency for float32 / float16 / int8 storage."""
+    return pd.DataFrame(storage_report(artifact["drug_ids"], artifact["latent"], k=k, sample_size=sample_size))
+
+
+def train_autoencoder(ratings_file=DEFAULT_RATINGS_FILE):
+    return build_similarity_index(fit_autoencoder(ratings_file))
 
 # Function to get most similar drugs
-def get_similar_drugs_autoencoder(drug_id, sim_df, top_n=5):
-    if drug_id not in sim_df.index:
+# (sim_index: an exact SimilarityIndex or an approximate ann_index.IVFIndex)
+def get_similar_drugs_autoencoder(drug_id, sim_index, top_n=5):
+    with metrics.span("similarity_query"):
+        result = sim_index.query(drug_id, top_n)
+    metrics.count("similarity_queries", result="missing" if result is None else "found")
+    if result is None:
         return f"Drug ID {drug_id} not found in dataset"
 
-    # similar_drugs = sim_df[drug_id].sort_values(ascending=False).iloc[1:top_n+1]
-    similar_drugs = sim_df[drug_id].sort_values(ascending=False).iloc[1:top_n+1].reset_index()
-    similar_drugs.columns = ["Drug", "Similarity Score"]
-    return similar_drugs
+    neighbor_ids, scores = result
+    return pd.DataFrame({"Drug": neighbor_ids, "Similarity Score": scores})
+
+
+def get_similar_drugs_batch(drug_ids, sim_index, top_n=5):
+    """Neighbors for many drug IDs at once; returns a similarity_index.BatchResult."""
+    with metrics.span("similarity_batch_query"):
+        result = sim_index.query_batch([str(drug_id).strip() for drug_id in drug_ids], top_n)
+    metrics.count("similarity_queries", int((~result.missing).sum()), result="found")
+    metrics.count("similarity_queries", int(result.missing.sum()), result="missing")
+    return result
+
+
+def batch_result_frame(result):
+    """Flatten a BatchResult into one row per (query, neighbor), skipping missing queries."""
+    hits = ~result.missing
+    k = result.neighbor_ids.shape[1]
+    return pd.DataFrame({
+        "Query": np.repeat(result.query_ids[hits], k),
+        "Rank": np.tile(np.arange(1, k + 1), int(hits.sum())),
+        "Drug": result.neighbor_ids[hits].ravel(),
+        "Similarity Score": result.scores[hits].ravel(),
+    })
 
 # # Example Usage
-# sim_df = train_autoencoder()
+# artifact = load_or_train()  # trains once, then reuses ./artifacts/<hash>/
+# sim_index = build_similarity_index(artifact)
 # drug_id_example = "54675785"  # Example DrugBank ID or PubChem CID
 # print(f"Most similar drugs to {drug_id_example}:")
-# print(get_similar_drugs_autoencoder(drug_id_example, sim_df))
+# print(get_similar_drugs_autoencoder(drug_id_example, sim_index))
+
+if __name__ == "__main__":
+    # Offline training: python drug_discovery.py [ratings_file] [artifact_dir]
+    import sys
+    artifact = load_or_train(*sys.argv[1:3])
+    print(f"Artifact {artifact['version']} ready for {len(artifact['drug_ids'])} drugs")
@@ -0,0 +1,259 @@
+import functools
+import json
+import threading
+
+import metrics
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+EXTRACTION_PROMPT = """
+{
+"task": "You are a medical and genetic expert. I am providing you with a medical paper or report regarding a genetic variant. Your task is to extract the following key information from the text.",
+"fields": {
+    "Variant": "The identifier of the genetic variant (e.g., rsID like rs113993960).",
+    "Genes": "The gene(s) associated with the variant (e.g., CFTR).",
+    "Drugs": "The drug(s) or treatment(s) associated with the variant or condition.",
+    "Association": "The relationship between the genetic variant and the associated condition or phenotype.",
+    "Significance": "The reported significance of the association (e.g., not stated, significant, etc.).",
+    "P-Value": "The p-value associated with the statistical analysis of the variant's significance.",
+    "Number of Cases": "The number of cases or individuals with the condition.",
+    "Number of Controls": "The number of controls or individuals without the condition.",
+    "Biogeographical Groups": "Information on the biogeographical groups or populations analyzed.",
+    "Phenotype Categories": "The phenotype categories or traits related to the variant.",
+    "Pediatric": "Any details regarding pediatric (children) cases or studies mentioned.",
+    "More Details": "Any additional details, such as mechanisms, biological processes, etc.",
+    "Literature": "PMID or DOI of the original paper or report."
+},
+"example_report": {
+    "Variant": "rs113993960",
+    "Genes": "CFTR",
+    "Drugs": "ivacaftor / lumacaftor",
+    "Association": "Genotype del/del is associated with decreased severity of Exocrine Pancreatic Insufficiency when treated with ivacaftor / lumacaftor in children with Cystic Fibrosis.",
+    "Significance": "not stated",
+    "P-Value": "1",
+    "Number of Cases": "0",
+    "Number of Controls": "Unknown",
+    "Biogeographical Groups": "Efficacy",
+    "Phenotype Categories": "PMIID:34511391"
+},
+"instruction": "I will provide the medical report or paper. Please provide the extracted information. If any information is not present, please state 'Not stated'. Do not return anything except for the required fields."
+}
+"""
+
+# Field name -> description, straight from the prompt so the schema never drifts from it
+FIELD_DESCRIPTIONS = json.loads(EXTRACTION_PROMPT)["fields"]
+
+_parse_counts = {"parsed": 0, "recovered": 0, "failed": 0}
+_parse_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def extraction_config():
+    """GenerateContentConfig for JSON-mode output constrained to the prompt's fields.
+
+    Every field is a string: the prompt asks for 'Not stated' when a value is missing,
+    and values such as p-values or cohort sizes are often ranges or prose.
+    """
+    from google.genai import types
+    schema = types.Schema(
+        type=types.Type.OBJECT,
+        properties={field: types.Schema(type=types.Type.STRING, description=description)
+                    for field, description in FIELD_DESCRIPTIONS.items()},
+        required=list(FIELD_DESCRIPTIONS),
+        property_ordering=list(FIELD_DESCRIPTIONS),
+    )
+    return types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+
+
+def _count_parse(result):
+    with _parse_lock:
+        _parse_counts[result] += 1
+    metrics.count("extraction_parses", result=result)
+
+
+def parse_stats():
+    """Responses parsed cleanly, recovered from malformed/partial JSON, and unusable (this process)."""
+    with _parse_lock:
+        return dict(_parse_counts)
+
+
+def _scalar_end(text, i):
+    while i < len(text) and (text[i].isalnum() or text[i] in "+-."):
+        i += 1
+    return i
+
+
+class PartialJsonScanner:
+    """Single pass over a growing text for the first JSON object in it; see close().
+
+    feed() only scans the new text, so a streamed response is read once overall.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.start = None
+        self.position = 0
+        self.frames = []  # open containers: [closer, expecting] with expecting in key/colon/value/comma
+        self.checkpoint = None  # longest prefix that closes into valid JSON: (end, closing brackets)
+        self.in_string = self.escape = self.string_is_value = False
+        self.end = None  # set once the object is complete
+        self.broken = False
+
+    def _closers(self):
+        return "".join(frame[0] for frame in reversed(self.frames))
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.end is not None or self.broken:
+            return
+        text, frames = self.buffer, self.frames
+        if self.start is None:
+            self.start = text.find("{", self.position)
+            if self.start < 0:
+                self.start, self.position = None, len(text)
+                return
+            self.position = self.start
+        i = self.position
+        while i < len(text):
+            ch = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if frames[-1][1] == "key":
+                        frames[-1][1] = "colon"
+                    else:
+                        frames[-1][1] = "comma"
+                        self.checkpoint = (i + 1, self._closers())
+            elif ch == '"':
+                self.in_string = True
+                self.string_is_value = frames[-1][1] == "value"
+            elif ch in "{[":
+                if frames:
+                    frames[-1][1] = "comma"
+                frames.append(["}" if ch == "{" else "]", "key" if ch == "{" else "value"])
+                self.checkpoint = (i + 1, self._closers())
+            elif ch in "}]":
+                if not frames or frames[-1][0] != ch:
+                    self.broken = True
+                    break
+                frames.pop()
+                if not frames:
+                    self.end = i + 1
+                    break
+                self.checkpoint = (i + 1, self._closers())
+            elif ch == ",":
+                frames[-1][1] = "key" if frames[-1][0] == "}" else "value"
+            elif ch == ":":
+                frames[-1][1] = "value"
+            elif not ch.isspace():
+                end = _scalar_end(text, i)
+                if end == i:
+                    self.broken = True
+                    break
+                if end == len(text):
+                    # A number or literal that may still be growing: wait for more text
+                    break
+                frames[-1][1] = "comma"
+                self.checkpoint = (end, self._closers())
+                i = end
+                continue
+            i += 1
+        self.position = i
+
+    def close(self, partial_strings=False):
+        """The object so far, closed off so it parses; None if no object has started.
+
+        A finished object is returned as is (prose before or after it is dropped).
+        Otherwise everything up to the last complete value is kept and the open
+        brackets are closed. partial_strings=True also keeps a string value that is
+        still being written (for previews while a response streams in).
+        """
+        if self.start is None:
+            return None
+        text = self.buffer
+        if self.end is not None:
+            return text[self.start:self.end]
+        if partial_strings and self.in_string and self.string_is_value and not self.broken:
+            return text[self.start:len(text) - self.escape] + '"' + self._closers()
+        if self.checkpoint is None:
+            return None
+        return text[self.start:self.checkpoint[0]] + self.checkpoint[1]
+
+
+def close_partial_json(text):
+    """The first JSON object in text, closed off after its last complete value (or None)."""
+    scanner = PartialJsonScanner()
+    scanner.feed(text)
+    return scanner.close()
+
+
+def _loads_object(text):
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _strip_fence(text):
+    if "```json" in text:
+        text = text.split("```json", 1)[1]
+        return text.split("```", 1)[0]
+    return text
+
+
+def recover_extraction(text):
+    """Best-effort dict from a model response, or None. Does not count anything."""
+    text = _strip_fence(text or "").strip()
+    data = _loads_object(text)
+    if data is not None:
+        return data
+    closed = close_partial_json(text)
+    return _loads_object(closed) if closed is not None else None
+
+
+def parse_extraction(response_text):
+    """Parse a model response into the extraction dict; raises ValueError if nothing is usable.
+
+    Accepts plain JSON (JSON mode), JSON in ```json fences, JSON surrounded by prose,
+    and truncated objects (the fields that were completed are kept).
+    """
+    text = _strip_fence(response_text or "").strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = None
+    if isinstance(data, dict):
+        _count_parse("parsed")
+        return data
+    data = recover_extraction(text)
+    if data:
+        _count_parse("recovered")
+        return data
+    _count_parse("failed")
+    raise ValueError("The response did not contain a JSON object with the extracted fields.")
+
+
+class StreamingExtractionParser:
+    """Feed streamed response text; feed() returns the fields so far, including one still being written (or None)."""
+
+    def __init__(self):
+        self.scanner = PartialJsonScanner()
+        self.partial = None
+
+    @property
+    def text(self):
+        return self.scanner.buffer
+
+    def feed(self, chunk):
+        if chunk:
+            self.scanner.feed(chunk)
+            closed = self.scanner.close(partial_strings=True)
+            partial = _loads_object(closed) if closed is not None else None
+            if partial:
+                self.partial = partial
+        return self.partial
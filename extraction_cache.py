@@ -0,0 +1,99 @@
+import hashlib
+import json
+import threading
+import time
+
+import metrics
+from sqlite_db import STATS_TABLE, connect, ensure_parent_dir, increment
+
+DEFAULT_CACHE_PATH = "./cache/extractions.sqlite"
+
+
+def extraction_key(content_bytes, prompt, model):
+    """Cache key: hash of the model name, prompt text and document bytes."""
+    digest = hashlib.sha256()
+    for part in (model.encode(), prompt.encode(), content_bytes):
+        # Length-prefix each part so different splits never collide
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Persistent SQLite cache of extraction results with size- and age-based eviction.
+
+    Entries are evicted when older than max_age_seconds, and least-recently-used
+    entries are dropped once the stored JSON exceeds max_bytes. Hit/miss counters
+    are kept in the database, so they survive restarts and are shared by processes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=256 * 1024 * 1024, max_age_seconds=30 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        ensure_parent_dir(path)
+        with connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            conn.execute(STATS_TABLE)
+
+    def get(self, key):
+        """Cached extraction dict for key, or None on a miss (expired entries count as misses)."""
+        now = time.time()
+        with self._lock, connect(self.path) as conn:
+            row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.max_age_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                increment(conn, "misses")
+                metrics.count("extraction_cache_lookups", result="miss")
+                return None
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            increment(conn, "hits")
+            metrics.count("extraction_cache_lookups", result="hit")
+            return json.loads(row[0])
+
+    def put(self, key, data):
+        value = json.dumps(data)
+        now = time.time()
+        with self._lock, connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM entries WHERE created < ?", (now - self.max_age_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        increment(conn, "evictions", len(evicted))
+
+    def stats(self):
+        """Hit/miss/eviction counters plus current entry count and stored bytes."""
+        with self._lock, connect(self.path) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
@@ -0,0 +1,360 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import httpx
+
+import metrics
+
+# Request priorities: lower numbers are admitted first when the rate limit is hit
+INTERACTIVE = 0  # chatbot answers and question embeddings
+EXTRACTION = 1   # single-document extraction started by a user
+BATCH = 2        # batch extraction
+BACKGROUND = 3   # housekeeping that nobody is waiting on
+PRIORITY_NAMES = {INTERACTIVE: "interactive", EXTRACTION: "extraction", BATCH: "batch", BACKGROUND: "background"}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class _Abandoned(Exception):
+    """The shared in-flight request was cancelled; a waiter should send it itself."""
+
+
+class PriorityRateLimiter:
+    """Token bucket that hands out tokens in priority order (FIFO within a priority)."""
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.waiting = []  # heap of (priority, sequence number)
+        self.sequence = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority, deadline=None, cancelled=None):
+        """Block until this request may be sent; deadline is a time.monotonic() timestamp.
+
+        cancelled is an optional threading.Event: once it is set (followed by cancel()),
+        the request leaves the queue and concurrent.futures.CancelledError is raised.
+        """
+        with self.condition:
+            entry = (priority, next(self.sequence))
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    if cancelled is not None and cancelled.is_set():
+                        raise concurrent.futures.CancelledError()
+                    self._refill()
+                    first = self.waiting[0] == entry
+                    if first and self.tokens >= 1:
+                        heapq.heappop(self.waiting)
+                        self.tokens -= 1
+                        self.condition.notify_all()
+                        return
+                    wait = (1 - self.tokens) / self.rate if first else None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise DeadlineExceeded("Deadline passed while waiting for the rate limiter")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self.condition.wait(wait)
+            except BaseException:
+                if entry in self.waiting:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self.condition.notify_all()
+                raise
+
+    def cancel(self, cancelled):
+        """Set a waiter's cancelled event and wake it up."""
+        with self.condition:
+            cancelled.set()
+            self.condition.notify_all()
+
+
+def request_key(model, contents, config=None):
+    """Hash identifying identical requests (model, prompt parts incl. document bytes, config)."""
+    digest = hashlib.sha256(model.encode())
+    for part in contents:
+        inline = getattr(part, "inline_data", None)
+        if isinstance(part, str):
+            data = part.encode()
+        elif inline is not None:
+            data = (inline.mime_type or "").encode() + inline.data
+        else:
+            data = repr(part).encode()
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    if config is not None:
+        digest.update(repr(config).encode())
+    return digest.hexdigest()
+
+
+def is_retryable(error):
+    from google.genai import errors
+    if isinstance(error, errors.APIError):
+        return error.code in RETRY_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+class GenAIGateway:
+    """Single entry point for GenAI calls: rate limiting, priorities, retries, deadlines, de-duplication.
+
+    Every request takes a token from a shared token bucket (requests_per_minute,
+    bursts up to `burst`); when requests queue up, lower priority numbers go first,
+    so interactive chat is served before batch extraction. Retryable failures (429,
+    5xx, connection errors) are retried with jittered exponential backoff until
+    max_retries or the request deadline. Identical requests that are already in
+    flight share one call (except generate_stream, used for chat) (waiting at most until their own deadline; if
+    the shared call is cancelled, a waiter sends the request itself).
+
+    client is a genai.Client, or a function returning one that is called on the
+    first request (so importing google.genai is deferred until it is needed).
+    """
+
+    def __init__(self, client, requests_per_minute=60, burst=5, max_retries=4, backoff=1.0,
+                 max_backoff=30.0, default_deadline=180.0):
+        self._client = client
+        self.limiter = PriorityRateLimiter(requests_per_minute / 60.0, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.default_deadline = default_deadline
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "retries": 0, "deduplicated": 0, "deadline_exceeded": 0, "failures": 0}
+
+    @property
+    def client(self):
+        if not hasattr(self._client, "models"):
+            with self._lock:
+                if not hasattr(self._client, "models"):
+                    self._client = self._client()
+        return self._client
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+        metrics.count(f"genai_{name}")
+
+    def _deadline(self, deadline):
+        return time.monotonic() + (self.default_deadline if deadline is None else deadline)
+
+    def _retry_delay(self, attempt, error, deadline):
+        """Seconds to wait before retrying, or None if the error is final."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * (0.5 + random.random())
+        if time.monotonic() + delay >= deadline:
+            return None
+        self._count("retries")
+        return delay
+
+    def _join_inflight(self, key):
+        """(future, owner): owner is True if the caller must perform the request."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters["deduplicated"] += 1
+                metrics.count("genai_deduplicated")
+                return future, False
+            future = concurrent.futures.Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _finish_inflight(self, key, future, result=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None and not isinstance(error, Exception):
+            # The owner was cancelled (or interrupted): waiters retry instead of waiting forever
+            error = _Abandoned()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _waiter_timeout(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise self._deadline_exceeded()
+        return remaining
+
+    def _deadline_exceeded(self):
+        self._count("deadline_exceeded")
+        return DeadlineExceeded("Deadline passed while waiting for an identical request")
+
+    def _call(self, send, priority, deadline):
+        for attempt in itertools.count():
+            try:
+                with metrics.span("genai_queue", priority=PRIORITY_NAMES.get(priority, str(priority))):
+                    self.limiter.acquire(priority, deadline)
+            except DeadlineExceeded:
+                self._count("deadline_exceeded")
+                raise
+            self._count("requests")
+            try:
+                with metrics.span("genai_request", priority=PRIORITY_NAMES.get(priority, str(priority))):
+                    return send()
+            except Exception as e:
+                delay = self._retry_delay(attempt, e, deadline)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                time.sleep(delay)
+
+    async def _acall(self, send, priority, deadline):
+        for attempt in itertools.count():
+            try:
+                cancelled = threading.Event()
+                with metrics.span("genai_queue", priority=PRIORITY_NAMES.get(priority, str(priority))):
+                    await asyncio.to_thread(self.limiter.acquire, priority, deadline, cancelled)
+            except asyncio.CancelledError:
+                # Cancelling the task does not stop the thread: take it out of the queue
+                self.limiter.cancel(cancelled)
+                raise
+            except DeadlineExceeded:
+                self._count("deadline_exceeded")
+                raise
+            self._count("requests")
+            try:
+                with metrics.span("genai_request", priority=PRIORITY_NAMES.get(priority, str(priority))):
+                    return await send()
+            except Exception as e:
+                delay = self._retry_delay(attempt, e, deadline)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                await asyncio.sleep(delay)
+
+    def generate(self, model, contents, priority=EXTRACTION, deadline=None, config=None):
+        """Blocking generate_content through the limiter; deadline is in seconds from now."""
+        key = request_key(model, contents, config)
+        deadline = self._deadline(deadline)
+        future, owner = self._join_inflight(key)
+        while not owner:
+            try:
+                return future.result(timeout=self._waiter_timeout(deadline))
+            except concurrent.futures.TimeoutError:
+                raise self._deadline_exceeded() from None
+            except _Abandoned:
+                future, owner = self._join_inflight(key)
+        try:
+            result = self._call(
+                lambda: self.client.models.generate_content(model=model, contents=contents, config=config),
+                priority, deadline,
+            )
+        except BaseException as e:
+            self._finish_inflight(key, future, error=e)
+            raise
+        self._finish_inflight(key, future, result)
+        return result
+
+    async def agenerate(self, model, contents, priority=EXTRACTION, deadline=None, config=None):
+        """generate() for asyncio callers, using the async GenAI client."""
+        key = request_key(model, contents, config)
+        deadline = self._deadline(deadline)
+        future, owner = self._join_inflight(key)
+        while not owner:
+            try:
+                # shield: a cancelled or timed-out waiter must not cancel the shared request
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                              self._waiter_timeout(deadline))
+            except asyncio.TimeoutError:
+                raise self._deadline_exceeded() from None
+            except _Abandoned:
+                future, owner = self._join_inflight(key)
+        try:
+            result = await self._acall(
+                lambda: self.client.aio.models.generate_content(model=model, contents=contents, config=config),
+                priority, deadline,
+            )
+        except BaseException as e:
+            self._finish_inflight(key, future, error=e)
+            raise
+        self._finish_inflight(key, future, result)
+        return result
+
+    def generate_stream(self, model, contents, priority=INTERACTIVE, deadline=None, config=None):
+        """Streaming generate_content; retried only if it fails before the first chunk arrives."""
+        deadline = self._deadline(deadline)
+
+        def open_stream():
+            stream = self.client.models.generate_content_stream(model=model, contents=contents, config=config)
+            return stream, next(stream, None)
+
+        start = time.perf_counter()
+        stream, first = self._call(open_stream, priority, deadline)
+        metrics.observe("genai_first_chunk_seconds", time.perf_counter() - start)
+        if first is not None:
+            yield first
+        yield from stream
+
+    async def agenerate_stream(self, model, contents, priority=EXTRACTION, deadline=None, config=None):
+        """generate_stream() for asyncio callers: an async iterator of response chunks.
+
+        Identical streams share one call: the first caller streams it, callers that
+        join while it is in flight get all of its chunks at once when it finishes.
+        """
+        key = "stream:" + request_key(model, contents, config)
+        deadline = self._deadline(deadline)
+        future, owner = self._join_inflight(key)
+        while not owner:
+            try:
+                chunks = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                                self._waiter_timeout(deadline))
+            except asyncio.TimeoutError:
+                raise self._deadline_exceeded() from None
+            except _Abandoned:
+                future, owner = self._join_inflight(key)
+                continue
+            for chunk in chunks:
+                yield chunk
+            return
+
+        async def open_stream():
+            stream = await self.client.aio.models.generate_content_stream(model=model, contents=contents,
+                                                                         config=config)
+            return stream, await anext(stream, None)
+
+        chunks = []
+        try:
+            start = time.perf_counter()
+            stream, first = await self._acall(open_stream, priority, deadline)
+            metrics.observe("genai_first_chunk_seconds", time.perf_counter() - start)
+            if first is not None:
+                chunks.append(first)
+                yield first
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        except BaseException as e:
+            # Includes GeneratorExit when the caller stops early: waiters then send it themselves
+            self._finish_inflight(key, future, error=e)
+            raise
+        self._finish_inflight(key, future, chunks)
+
+    def embed(self, model, text, priority=INTERACTIVE, deadline=None):
+        response = self._call(
+            lambda: self.client.models.embed_content(model=model, contents=text),
+            priority, self._deadline(deadline),
+        )
+        return response.embeddings[0].values
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._inflight), queued=len(self.limiter.waiting))
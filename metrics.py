@@ -0,0 +1,178 @@
+"""Timing spans, counters and size observations, exported as Prometheus text or JSON log lines.
+
+Off unless PHARMORE_METRICS is set: "1" collects in-process, "json" also writes one
+JSON line per finished span to stderr. When off, every call returns immediately
+(span() hands back a shared no-op context manager).
+"""
+import contextlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+PREFIX = "pharmore"
+
+_lock = threading.Lock()
+_counters = {}   # (name, labels) -> value
+_summaries = {}  # (name, labels) -> [count, sum, min, max]
+_NOOP = contextlib.nullcontext()
+_enabled = False
+_log_json = False
+
+
+def configure(mode):
+    """Set the mode at runtime: "" / "0" (off), "1" (collect) or "json" (collect and log spans)."""
+    global _enabled, _log_json
+    mode = (mode or "").lower()
+    _enabled = mode not in ("", "0", "false", "off")
+    _log_json = mode == "json"
+
+
+configure(os.getenv("PHARMORE_METRICS"))
+
+
+def enabled():
+    return _enabled
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def count(name, amount=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Record one value (a duration in seconds, a payload size in bytes, ...)."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.get(key)
+        if summary is None:
+            _summaries[key] = [1, value, value, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = min(summary[2], value)
+            summary[3] = max(summary[3], value)
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        observe(f"{self.name}_seconds", seconds, **self.labels)
+        if exc_type is not None:
+            count(f"{self.name}_errors", **self.labels)
+        if _log_json:
+            print(json.dumps({"time": time.time(), "span": self.name, "seconds": round(seconds, 6),
+                              "error": exc_type.__name__ if exc_type else None, **self.labels}),
+                  file=sys.stderr, flush=True)
+        return False
+
+
+def span(name, **labels):
+    """Context manager timing a block into the `<name>_seconds` summary (errors counted too)."""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, labels)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _summaries.clear()
+
+
+def snapshot():
+    """Current values as plain dicts, e.g. for JSON export or a diagnostics table."""
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+        summaries = [{"name": name, "labels": dict(labels), "count": c, "sum": s, "min": lo, "max": hi,
+                      "mean": s / c}
+                     for (name, labels), (c, s, lo, hi) in sorted(_summaries.items())]
+    return {"counters": counters, "summaries": summaries}
+
+
+def merge(other):
+    """Add a snapshot() taken in another process (e.g. a pool worker) to the values here."""
+    if not _enabled:
+        return
+    with _lock:
+        for counter in other["counters"]:
+            key = _key(counter["name"], counter["labels"])
+            _counters[key] = _counters.get(key, 0) + counter["value"]
+        for theirs in other["summaries"]:
+            key = _key(theirs["name"], theirs["labels"])
+            summary = _summaries.get(key)
+            if summary is None:
+                _summaries[key] = [theirs["count"], theirs["sum"], theirs["min"], theirs["max"]]
+            else:
+                summary[0] += theirs["count"]
+                summary[1] += theirs["sum"]
+                summary[2] = min(summary[2], theirs["min"])
+                summary[3] = max(summary[3], theirs["max"])
+
+
+def hit_rates():
+    """Hit rate per counter that is split by a result="hit"/"miss" label."""
+    totals = {}
+    for counter in snapshot()["counters"]:
+        result = counter["labels"].get("result")
+        if result in ("hit", "miss"):
+            hits, lookups = totals.get(counter["name"], (0, 0))
+            totals[counter["name"]] = (hits + (counter["value"] if result == "hit" else 0), lookups + counter["value"])
+    return {name: hits / lookups for name, (hits, lookups) in totals.items() if lookups}
+
+
+def _metric_name(name):
+    return f"{PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+def prometheus_text():
+    """Prometheus text exposition format: counters as *_total, observations as summaries."""
+    current = snapshot()
+    lines, typed = [], set()
+    for counter in current["counters"]:
+        name = _metric_name(counter["name"]) + "_total"
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels_text(counter['labels'])} {counter['value']}")
+    for summary in current["summaries"]:
+        name = _metric_name(summary["name"])
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} summary")
+        labels = _labels_text(summary["labels"])
+        lines.append(f"{name}_count{labels} {summary['count']}")
+        lines.append(f"{name}_sum{labels} {summary['sum']}")
+    return "\n".join(lines) + "\n"
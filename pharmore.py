@@ -0,0 +1,243 @@
+"""Headless batch jobs: python pharmore.py extract ... | python pharmore.py similar ...
+
+Results are appended to a checkpoint file (JSON lines) as each item finishes, so an
+interrupted run picks up where it stopped; the final output is written from the
+checkpoint once every item is done.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import pathlib
+import sys
+
+import pandas as pd
+
+import metrics
+from batch_extraction import extract_many
+from extraction import DEFAULT_MODEL, EXTRACTION_PROMPT, extraction_config, parse_extraction
+from extraction_cache import ExtractionCache
+from results_store import DEFAULT_RESULTS_PATH, ResultsStore
+from url_fetcher import UrlFetcher
+
+
+class Checkpoint:
+    """Append-only JSON-lines log of finished work items: {"key", "records", "error"}."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            # Drop a torn last line from a killed run so new entries start on a fresh line
+            with open(path, "rb+") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+
+    def entries(self):
+        """Latest entry per key."""
+        entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    entries[entry["key"]] = entry
+        return entries
+
+    def done(self):
+        """Keys finished without error; failed items are retried on the next run."""
+        return {key for key, entry in self.entries().items() if not entry.get("error")}
+
+    def append(self, key, records=(), error=None):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"key": key, "records": list(records), "error": error}, default=str) + "\n")
+
+    def records(self):
+        return [record for entry in self.entries().values() if not entry.get("error") for record in entry["records"]]
+
+    def errors(self):
+        return {key: entry["error"] for key, entry in self.entries().items() if entry.get("error")}
+
+
+def write_output(frame, out):
+    """Write by extension: .parquet, .jsonl, .json or CSV."""
+    suffix = pathlib.Path(out).suffix.lower()
+    if suffix == ".parquet":
+        frame.to_parquet(out, index=False)
+    elif suffix == ".jsonl":
+        frame.to_json(out, orient="records", lines=True)
+    elif suffix == ".json":
+        frame.to_json(out, orient="records")
+    else:
+        frame.to_csv(out, index=False)
+
+
+def finish(checkpoint, out):
+    """Write the final output from the checkpoint; keep the checkpoint if some items failed."""
+    frame = pd.DataFrame(checkpoint.records())
+    write_output(frame, out)
+    errors = checkpoint.errors()
+    for key, error in errors.items():
+        print(f"{key}: {error}", file=sys.stderr)
+    if not errors:
+        os.remove(checkpoint.path)
+    print(f"Wrote {len(frame)} rows to {out} ({len(errors)} failed)")
+    return 1 if errors else 0
+
+
+def read_sources(source):
+    """PDF paths under a directory, or the URLs/paths listed one per line in a text file."""
+    path = pathlib.Path(source)
+    if path.is_dir():
+        return sorted(str(p) for p in path.rglob("*.pdf"))
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def run_extract(sources, out, checkpoint_path=None, model=DEFAULT_MODEL, concurrency=8, pages_per_chunk=20,
+                processes=None, requests_per_minute=60, cache_path="./cache/extractions.sqlite",
+                store_path=DEFAULT_RESULTS_PATH):
+    """Extract every source (PDF path or URL) and write one row per document to `out`."""
+    from google import genai
+    from genai_gateway import GenAIGateway
+
+    checkpoint = Checkpoint(checkpoint_path or f"{out}.checkpoint.jsonl")
+    done = checkpoint.done()
+    pending = [(name, None) for name in sources if name not in done]
+    print(f"{len(done)} of {len(sources)} documents already done, {len(pending)} to extract")
+
+    gateway = GenAIGateway(genai.Client(api_key=os.getenv("GENAI_KEY")), requests_per_minute=requests_per_minute)
+    cache = ExtractionCache(cache_path)
+    store = ResultsStore(store_path)
+
+    async def consume(executor):
+        finished = 0
+        async for name, data, error in extract_many(
+            pending, gateway, EXTRACTION_PROMPT, model, parse_extraction, cache=cache, concurrency=concurrency,
+            fetcher=UrlFetcher(), pages_per_chunk=pages_per_chunk, executor=executor, store=store,
+            config=extraction_config(),
+        ):
+            checkpoint.append(name, [] if error else [{"Source": name, **data}], error)
+            finished += 1
+            print(f"[{finished}/{len(pending)}] {name}{': ' + error if error else ''}")
+
+    # PDF splitting is the CPU-bound step; model calls and downloads stay on the event loop
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        asyncio.run(consume(executor))
+    return finish(checkpoint, out)
+
+
+_worker_index = None
+
+
+def _load_worker_index(version, artifact_dir, storage, nprobe=None, metrics_mode=None):
+    global _worker_index
+    metrics.configure(metrics_mode)
+    from drug_discovery import build_similarity_index, load_ann_index, load_artifact
+    artifact = load_artifact(version, artifact_dir)
+    if nprobe:
+        _worker_index = load_ann_index(artifact, artifact_dir, nprobe=nprobe, storage=storage)
+    else:
+        _worker_index = build_similarity_index(artifact, storage=storage)
+    metrics.reset()  # index loading is reported by the parent process
+
+
+def _query_chunk(drug_ids, k):
+    from drug_discovery import batch_result_frame, get_similar_drugs_batch
+    result = get_similar_drugs_batch(drug_ids, _worker_index, top_n=k)
+    neighbors = {query: group.to_dict("records") for query, group in batch_result_frame(result).groupby("Query")}
+    # This chunk's metrics go back to the parent, which merges them into its registry
+    worker_metrics = metrics.snapshot()
+    metrics.reset()
+    return ([(str(drug_id), neighbors.get(drug_id, [])) for drug_id in result.query_ids],
+            list(result.query_ids[result.missing]), worker_metrics)
+
+
+def run_similar(drug_ids, out, k=10, checkpoint_path=None, ratings_file=None, artifact_dir=None,
+                storage="float32", processes=None, chunk_size=1000, nprobe=None):
+    """Top-k similar drugs for every ID, one row per (query, neighbor), written to `out`.
+
+    With nprobe set, the approximate IVF index (drug_discovery.load_ann_index) is used
+    instead of an exact scan.
+    """
+    from drug_discovery import DEFAULT_ARTIFACT_DIR, DEFAULT_RATINGS_FILE, load_ann_index, load_or_train
+
+    checkpoint = Checkpoint(checkpoint_path or f"{out}.checkpoint.jsonl")
+    done = checkpoint.done()
+    drug_ids = list(dict.fromkeys(str(drug_id).strip() for drug_id in drug_ids))
+    pending = [drug_id for drug_id in drug_ids if drug_id not in done]
+    print(f"{len(drug_ids) - len(pending)} of {len(drug_ids)} drugs already done, {len(pending)} to query")
+
+    # Train (or load) once here so workers only map the saved artifact
+    artifact_dir = artifact_dir or DEFAULT_ARTIFACT_DIR
+    artifact = load_or_train(ratings_file or DEFAULT_RATINGS_FILE, artifact_dir)
+    if nprobe:
+        load_ann_index(artifact, artifact_dir, nprobe=nprobe, storage=storage)
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    with concurrent.futures.ProcessPoolExecutor(
+        processes, initializer=_load_worker_index, initargs=(artifact["version"], artifact_dir, storage, nprobe, "1" if metrics.enabled() else "")
+    ) as executor:
+        futures = [executor.submit(_query_chunk, chunk, k) for chunk in chunks]
+        for finished, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            results, missing, worker_metrics = future.result()
+            metrics.merge(worker_metrics)
+            # Unknown IDs are recorded with no neighbors so resumed runs skip them too
+            for drug_id, records in results:
+                checkpoint.append(drug_id, records)
+            print(f"[{finished}/{len(chunks)}] chunks queried"
+                  + (f", not found in dataset: {', '.join(missing)}" if missing else ""))
+    return finish(checkpoint, out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pharmore", description=__doc__.splitlines()[0])
+    parser.add_argument("--metrics", help="write timings and counters here at the end (.json, else Prometheus text)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract = commands.add_parser("extract", help="extract metadata from PDFs and URLs")
+    extract.add_argument("source", help="directory of PDFs, or a text file with one URL or path per line")
+    extract.add_argument("--out", required=True, help=".parquet, .csv, .json or .jsonl")
+    extract.add_argument("--checkpoint", help="default: <out>.checkpoint.jsonl")
+    extract.add_argument("--model", default=DEFAULT_MODEL)
+    extract.add_argument("--concurrency", type=int, default=8, help="documents in flight")
+    extract.add_argument("--pages-per-chunk", type=int, default=20)
+    extract.add_argument("--processes", type=int, help="PDF splitting processes (default: CPU count)")
+    extract.add_argument("--requests-per-minute", type=int, default=60)
+
+    similar = commands.add_parser("similar", help="top-k similar drugs for many drug IDs")
+    similar.add_argument("--ids", required=True, help="text file with one drug ID per line")
+    similar.add_argument("-k", type=int, default=10)
+    similar.add_argument("--out", required=True, help=".parquet, .csv, .json or .jsonl")
+    similar.add_argument("--checkpoint", help="default: <out>.checkpoint.jsonl")
+    similar.add_argument("--ratings", help="ratings file (default: ./ratings_mat.csv)")
+    similar.add_argument("--artifacts", help="artifact directory (default: ./artifacts)")
+    similar.add_argument("--storage", default="float32", choices=["float32", "float16", "int8"])
+    similar.add_argument("--ann", type=int, metavar="NPROBE",
+                         help="approximate search scanning NPROBE IVF lists per query (default: exact)")
+    similar.add_argument("--processes", type=int, help="query processes (default: CPU count)")
+    similar.add_argument("--chunk-size", type=int, default=1000, help="drug IDs per process task")
+
+    args = parser.parse_args(argv)
+    if args.metrics and not metrics.enabled():
+        metrics.configure("1")
+    if args.command == "extract":
+        sources = read_sources(args.source)
+        status = run_extract(sources, args.out, args.checkpoint, args.model, args.concurrency, args.pages_per_chunk,
+                             args.processes, args.requests_per_minute)
+    else:
+        with open(args.ids) as f:
+            drug_ids = [line.strip() for line in f if line.strip()]
+        status = run_similar(drug_ids, args.out, args.k, args.checkpoint, args.ratings, args.artifacts, args.storage,
+                             args.processes, args.chunk_size, args.ann)
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(json.dumps(metrics.snapshot(), indent=2) if args.metrics.endswith(".json")
+                    else metrics.prometheus_text())
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.preprocessing import MinMaxScaler
+
+# Supported ratings layouts:
+#   *.csv                dense drug x drug matrix, IDs in the header row / first column
+#   *.npy                dense float32 matrix (memory-mapped) + <name>.npy.ids.npz ID table
+#   *.npz                scipy.sparse matrix (save_npz) + <name>.npz.ids.npz ID table
+#   *.coo.csv, *.coo.tsv COO triples with a header: drug_id, other_drug_id, rating
+
+
+BINARY_FORMATS = (".npy", ".npz")
+
+
+def ids_path(ratings_file):
+    """Path of the ID table stored next to a binary ratings file (one per format, so
+    ratings.npy and ratings.npz never share IDs)."""
+    return ratings_file + ".ids.npz"
+
+
+def load_ratings(ratings_file):
+    ratings_df = pd.read_csv(ratings_file, index_col=0)  # Drugs as rows & cols
+
+    # Ensure drug IDs are consistent (convert to string to avoid float IDs)
+    ratings_df.index = ratings_df.index.astype(str)
+    ratings_df.columns = ratings_df.columns.astype(str)
+    return ratings_df
+
+
+def load_ids(ratings_file):
+    with np.load(ids_path(ratings_file)) as ids:
+        return ids["drug_ids"].astype(str), ids["columns"].astype(str)
+
+
+def load_coo_triples(ratings_file):
+    """Build a CSR matrix from (drug_id, other_drug_id, rating) rows; cost scales with nnz."""
+    sep = "\t" if ratings_file.endswith(".tsv") else ","
+    triples = pd.read_csv(ratings_file, sep=sep, dtype={0: str, 1: str})
+    row_ids, col_ids, values = (triples.iloc[:, i] for i in range(3))
+    rows, drug_ids = pd.factorize(row_ids.astype(str))
+    cols, columns = pd.factorize(col_ids.astype(str))
+    matrix = sp.coo_matrix(
+        (values.to_numpy(dtype=np.float32), (rows, cols)),
+        shape=(len(drug_ids), len(columns)),
+    ).tocsr()
+    matrix.sum_duplicates()
+    return matrix, np.asarray(drug_ids, dtype=str), np.asarray(columns, dtype=str)
+
+
+class ScaledMatrix:
+    """Row-indexable view that min-max scales rows on access.
+
+    Used for memory-mapped matrices so scaling never copies the whole matrix into
+    process memory; worker processes keep sharing the page-cached file.
+    """
+
+    def __init__(self, matrix, scaler):
+        self.matrix = matrix
+        self.scaler = scaler
+        self.scale = scaler.scale_.astype(np.float32)
+        self.offset = scaler.min_.astype(np.float32)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def __getitem__(self, rows):
+        return np.asarray(self.matrix[rows], dtype=np.float32) * self.scale + self.offset
+
+
+def load_ratings_matrix(ratings_file):
+    """Return (matrix, drug_ids, columns).
+
+    matrix is a dense ndarray, a read-only np.memmap (.npy) or a scipy CSR matrix.
+    """
+    if ratings_file.endswith(".npy"):
+        drug_ids, columns = load_ids(ratings_file)
+        return np.load(ratings_file, mmap_mode="r"), drug_ids, columns
+    if ratings_file.endswith((".coo.csv", ".coo.tsv")):
+        return load_coo_triples(ratings_file)
+    if ratings_file.endswith(".npz"):
+        drug_ids, columns = load_ids(ratings_file)
+        return sp.load_npz(ratings_file).tocsr().astype(np.float32), drug_ids, columns
+
+    ratings_df = load_ratings(ratings_file)
+    return (ratings_df.to_numpy(dtype=np.float32),
+            np.asarray(ratings_df.index, dtype=str),
+            np.asarray(ratings_df.columns, dtype=str))
+
+
+def save_ids(drug_ids, columns, ratings_file):
+    np.savez(ids_path(ratings_file),
+             drug_ids=np.asarray(drug_ids, dtype=str),
+             columns=np.asarray(columns, dtype=str))
+
+
+def save_dense_ratings(matrix, drug_ids, columns, ratings_file):
+    """Write a dense ratings matrix as a float32 .npy plus its ID table."""
+    np.save(ratings_file, np.ascontiguousarray(matrix, dtype=np.float32))
+    save_ids(drug_ids, columns, ratings_file)
+
+
+def save_sparse_ratings(matrix, drug_ids, columns, ratings_file):
+    """Write a sparse ratings matrix as scipy .npz plus its ID table."""
+    sp.save_npz(ratings_file, sp.csr_matrix(matrix, dtype=np.float32))
+    save_ids(drug_ids, columns, ratings_file)
+
+
+def convert_csv_to_sparse(csv_file, npz_file):
+    """One-time conversion of the dense CSV matrix to the sparse .npz layout."""
+    ratings_df = load_ratings(csv_file)
+    save_sparse_ratings(sp.csr_matrix(ratings_df.to_numpy(dtype=np.float32)),
+                        ratings_df.index, ratings_df.columns, npz_file)
+
+
+def convert_csv_to_npy(csv_file, npy_file):
+    """One-time conversion of the dense CSV matrix to the memory-mappable .npy layout."""
+    ratings_df = load_ratings(csv_file)
+    save_dense_ratings(ratings_df.to_numpy(dtype=np.float32),
+                       ratings_df.index, ratings_df.columns, npy_file)
+
+
+def fit_sparse_scaler(matrix):
+    """A MinMaxScaler fitted on a sparse matrix without densifying it.
+
+    Column min/max include the implicit zeros, so the parameters are identical to
+    fitting MinMaxScaler on the dense matrix.
+    """
+    data_min = matrix.min(axis=0).toarray().ravel()
+    data_max = matrix.max(axis=0).toarray().ravel()
+    data_range = data_max - data_min
+
+    scaler = MinMaxScaler()
+    scaler.data_min_ = data_min
+    scaler.data_max_ = data_max
+    scaler.data_range_ = data_range
+    scaler.scale_ = 1.0 / np.where(data_range == 0, 1.0, data_range)
+    scaler.min_ = -data_min * scaler.scale_
+    scaler.n_features_in_ = matrix.shape[1]
+    scaler.n_samples_seen_ = matrix.shape[0]
+    return scaler
+
+
+def sparse_minmax_transform(scaler, matrix):
+    """Apply a fitted MinMaxScaler to a CSR matrix, keeping implicit zeros at zero."""
+    scaled = sp.csr_matrix(matrix.multiply(scaler.scale_.astype(np.float32)), dtype=np.float32)
+    offsets = scaler.min_.astype(np.float32)
+    shifted = np.flatnonzero(offsets)
+    if len(shifted):
+        # An offset would turn implicit zeros into non-zeros; only columns with
+        # every entry stored can be shifted exactly without densifying.
+        stored_per_column = np.bincount(scaled.indices, minlength=scaled.shape[1])
+        if (stored_per_column[shifted] < scaled.shape[0]).any():
+            raise ValueError("Sparse scaling needs non-negative ratings (column minimum of 0)")
+        scaled.data += offsets[scaled.indices]
+    return scaled
+
+
+def fit_scaler(matrix, chunk_rows=4096):
+    """A MinMaxScaler fitted on any supported matrix type (row chunks for dense input)."""
+    if sp.issparse(matrix):
+        return fit_sparse_scaler(matrix)
+    scaler = MinMaxScaler()
+    for start in range(0, matrix.shape[0], chunk_rows):
+        scaler.partial_fit(matrix[start:start + chunk_rows])
+    return scaler
+
+
+def apply_scaler(matrix, scaler):
+    if sp.issparse(matrix):
+        return sparse_minmax_transform(scaler, matrix)
+    if isinstance(matrix, np.memmap):
+        # Scale lazily so the mapped file is never copied
+        return ScaledMatrix(matrix, scaler)
+    return scaler.transform(matrix).astype(np.float32)
+
+
+def scale_ratings(matrix):
+    """Min-max scale to [0, 1]; returns (scaled matrix, fitted scaler)."""
+    scaler = fit_scaler(matrix)
+    return apply_scaler(matrix, scaler), scaler
+
+
+def carry_over_scaler(old_scaler, old_columns, new_scaler, new_columns):
+    """Keep the previous scaling for columns that still exist, so unchanged rows scale identically."""
+    old_positions = {column: i for i, column in enumerate(old_columns)}
+    new_idx = [j for j, column in enumerate(new_columns) if column in old_positions]
+    old_idx = [old_positions[new_columns[j]] for j in new_idx]
+    for name in ("data_min_", "data_max_", "data_range_", "scale_", "min_"):
+        values = np.array(getattr(new_scaler, name), dtype=np.float64)
+        values[new_idx] = np.asarray(getattr(old_scaler, name))[old_idx]
+        setattr(new_scaler, name, values)
+    return new_scaler
+
+
+def _mix64(x):
+    # splitmix64 finalizer; uint64 array arithmetic wraps around
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def row_signatures(matrix, columns, chunk_rows=4096):
+    """64-bit fingerprint of each row's non-zero (column ID, raw value) pairs.
+
+    The fingerprint does not depend on column order, and adding or removing an
+    all-zero column leaves it unchanged, so it detects changed rows across files.
+    """
+    column_hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(str(c).encode(), digest_size=8).digest(), "little") for c in columns],
+        dtype=np.uint64,
+    )
+    signatures = np.zeros(matrix.shape[0], dtype=np.uint64)
+    for start in range(0, matrix.shape[0], chunk_rows):
+        block = matrix[start:start + chunk_rows]
+        block = sp.csr_matrix(block if sp.issparse(block) else np.asarray(block), dtype=np.float64)
+        block.eliminate_zeros()
+        mixed = _mix64(column_hashes[block.indices] ^ _mix64(block.data.view(np.uint64)))
+        block_rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+        np.add.at(signatures, start + block_rows, mixed)
+    return signatures
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+import metrics
+from chunked_extraction import is_stated, merge_extractions
+from sqlite_db import connect, ensure_parent_dir
+
+DEFAULT_RESULTS_PATH = "./data/extractions.sqlite"
+
+# Searchable fields -> how their values are split into individual terms
+INDEXED_FIELDS = {
+    "Variant": r"[,;]",
+    "Genes": r"[,;/]",
+    "Drugs": r"[,;/+]",
+    "Literature": r"[,;]",
+}
+
+_DOI = re.compile(r"10\.\d{4,9}/[^\s,;]+", re.IGNORECASE)
+_PMID = re.compile(r"PMI?ID\s*:?\s*(\d+)", re.IGNORECASE)
+
+
+def document_hash(content_bytes):
+    return hashlib.sha256(content_bytes).hexdigest()
+
+
+def extractor_id(model, prompt):
+    """Which extraction produced a record: the model name plus a hash of the prompt."""
+    return f"{model}:{hashlib.sha256(prompt.encode()).hexdigest()[:12]}"
+
+
+def literature_key(value):
+    """Normalized 'doi:...' or 'pmid:...' from a Literature field, or None."""
+    if not is_stated(value):
+        return None
+    text = str(value)
+    doi = _DOI.search(text)
+    if doi:
+        return f"doi:{doi.group().rstrip('.').lower()}"
+    pmid = _PMID.search(text) or re.fullmatch(r"\s*(\d{5,9})\s*", text)
+    return f"pmid:{pmid.group(1)}" if pmid else None
+
+
+def normalize_term(value):
+    return " ".join(value.lower().split())
+
+
+def record_terms(record):
+    """(field, normalized term) pairs to index for an extraction record."""
+    terms = set()
+    for field, separators in INDEXED_FIELDS.items():
+        value = record.get(field)
+        if not is_stated(value):
+            continue
+        if field == "Literature":
+            key = literature_key(value)
+            if key:
+                terms.add((field, key))
+        values = value if isinstance(value, (list, tuple)) else re.split(separators, str(value))
+        terms.update((field, normalize_term(str(part))) for part in values if str(part).strip())
+    return terms
+
+
+class ResultsStore:
+    """SQLite store of extraction results, searchable by variant, gene, drug and PMID/DOI.
+
+    One row per paper: a record whose Literature field names a PMID/DOI that is
+    already stored is merged into that paper (chunked_extraction.merge_extractions)
+    instead of added again. Every document hash seen is kept with the extractor_id
+    (model and prompt) that read it, so the same document is not sent to the same
+    model and prompt twice; a different model or prompt extracts it again and its
+    record is merged into the paper ahead of the earlier one. Indexed terms live in
+    a (field, term) table.
+    """
+
+    def __init__(self, path=DEFAULT_RESULTS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        ensure_parent_dir(path)
+        with connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id INTEGER PRIMARY KEY, literature_key TEXT UNIQUE, source TEXT, record TEXT NOT NULL, "
+                "created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS document_hashes ("
+                "hash TEXT PRIMARY KEY, document_id INTEGER NOT NULL REFERENCES documents (id), extractor TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS terms ("
+                "document_id INTEGER NOT NULL REFERENCES documents (id), field TEXT NOT NULL, term TEXT NOT NULL, "
+                "PRIMARY KEY (field, term, document_id)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS terms_document ON terms (document_id)")
+
+    def get(self, doc_hash, extractor=None):
+        """Stored record for a document hash, or None if this document was never extracted
+        (by `extractor`, when given)."""
+        sql = "SELECT d.record FROM document_hashes h JOIN documents d ON d.id = h.document_id WHERE h.hash = ?"
+        params = (doc_hash,)
+        if extractor is not None:
+            sql += " AND h.extractor = ?"
+            params += (extractor,)
+        with connect(self.path) as conn:
+            row = conn.execute(sql, params).fetchone()
+        metrics.count("results_store_lookups", result="hit" if row else "miss")
+        return json.loads(row[0]) if row else None
+
+    def add(self, doc_hash, record, source=None, extractor=None):
+        """Store an extraction record; returns the paper's document id."""
+        key = literature_key(record.get("Literature"))
+        now = time.time()
+        with self._lock, connect(self.path) as conn:
+            row = conn.execute("SELECT document_id, extractor FROM document_hashes WHERE hash = ?",
+                               (doc_hash,)).fetchone()
+            if row is not None and row[1] == extractor:
+                return row[0]
+            if row is not None:
+                # A re-extraction (new model or prompt) updates the paper this document was
+                # stored under and takes precedence over what it replaces
+                document_id = row[0]
+                conn.execute("DELETE FROM document_hashes WHERE hash = ?", (doc_hash,))
+                previous = conn.execute("SELECT record FROM documents WHERE id = ?", (document_id,)).fetchone()
+                record = merge_extractions([record, json.loads(previous[0])])
+                if key:
+                    conn.execute("UPDATE documents SET literature_key = ? WHERE id = ? AND literature_key IS NULL "
+                                 "AND NOT EXISTS (SELECT 1 FROM documents WHERE literature_key = ?)",
+                                 (key, document_id, key))
+            else:
+                row = conn.execute("SELECT id, record FROM documents WHERE literature_key = ?", (key,)).fetchone() \
+                    if key else None
+                document_id = row[0] if row is not None else None
+                if row is not None:
+                    record = merge_extractions([json.loads(row[1]), record])
+            if document_id is not None:
+                conn.execute("UPDATE documents SET record = ?, updated = ? WHERE id = ?",
+                             (json.dumps(record), now, document_id))
+                conn.execute("DELETE FROM terms WHERE document_id = ?", (document_id,))
+            else:
+                document_id = conn.execute(
+                    "INSERT INTO documents (literature_key, source, record, created, updated) VALUES (?, ?, ?, ?, ?)",
+                    (key, source, json.dumps(record), now, now),
+                ).lastrowid
+            conn.execute("INSERT INTO document_hashes (hash, document_id, extractor) VALUES (?, ?, ?)",
+                         (doc_hash, document_id, extractor))
+            conn.executemany("INSERT OR IGNORE INTO terms (document_id, field, term) VALUES (?, ?, ?)",
+                             [(document_id, field, term) for field, term in record_terms(record)])
+        return document_id
+
+    def search(self, variant=None, gene=None, drug=None, literature=None, limit=100):
+        """Records matching every given term (case-insensitive), newest first.
+
+        e.g. search(gene="CFTR", drug="ivacaftor"). literature accepts a PMID or DOI
+        in any of the usual spellings.
+        """
+        conditions = []
+        for field, value in (("Variant", variant), ("Genes", gene), ("Drugs", drug), ("Literature", literature)):
+            if value and value.strip():
+                term = (literature_key(value) or normalize_term(value)) if field == "Literature" else normalize_term(value)
+                conditions.append((field, term))
+        sql = "SELECT id, source, record FROM documents"
+        params = []
+        if conditions:
+            sql += " WHERE " + " AND ".join(
+                "id IN (SELECT document_id FROM terms WHERE field = ? AND term = ?)" for _ in conditions
+            )
+            params = [item for condition in conditions for item in condition]
+        sql += " ORDER BY updated DESC LIMIT ?"
+        with metrics.span("results_search"), connect(self.path) as conn:
+            rows = conn.execute(sql, params + [limit]).fetchall()
+        return [{"Source": source, **json.loads(record)} for _, source, record in rows]
+
+    def stats(self):
+        with connect(self.path) as conn:
+            documents = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            hashes = conn.execute("SELECT COUNT(*) FROM document_hashes").fetchone()[0]
+        return {"papers": documents, "documents": hashes}
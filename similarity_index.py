@@ -0,0 +1,273 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Neighbors for many queries at once: query_ids (Q,), neighbor_ids (Q, k), scores (Q, k)
+# and missing (Q,) marking query IDs that are not in the index (their rows hold "" / nan).
+BatchResult = namedtuple("BatchResult", ["query_ids", "neighbor_ids", "scores", "missing"])
+
+STORAGE_TYPES = ("float32", "float16", "int8")
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row so a dot product equals cosine similarity (zero rows stay zero)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(latent, storage, chunk_rows=65536):
+    """L2-normalized vectors in the requested storage type, plus the int8 per-dimension scale.
+
+    Rows are normalized chunk by chunk, so a memory-mapped latent matrix is never
+    copied whole in float32 when a compressed storage type is requested.
+    """
+    if storage == "float32":
+        return normalize_rows(latent), None
+    num_rows = latent.shape[0]
+    chunks = range(0, num_rows, chunk_rows)
+    if storage == "float16":
+        vectors = np.empty(latent.shape, dtype=np.float16)
+        for start in chunks:
+            vectors[start:start + chunk_rows] = normalize_rows(latent[start:start + chunk_rows])
+        return vectors, None
+
+    # int8 scalar quantization with a symmetric per-dimension scale
+    max_abs = np.zeros(latent.shape[1], dtype=np.float32)
+    for start in chunks:
+        max_abs = np.maximum(max_abs, np.abs(normalize_rows(latent[start:start + chunk_rows])).max(axis=0))
+    scale = np.where(max_abs == 0, 1.0, max_abs / 127.0).astype(np.float32)
+    vectors = np.empty(latent.shape, dtype=np.int8)
+    for start in chunks:
+        block = normalize_rows(latent[start:start + chunk_rows]) / scale
+        vectors[start:start + chunk_rows] = np.clip(np.rint(block), -127, 127)
+    return vectors, scale
+
+
+def top_k_rows(sims, k):
+    """Column positions and scores of the k largest entries of each row, best first.
+
+    Uses argpartition so each row costs O(N) instead of a full sort; ties are broken
+    by position to keep the ranking deterministic.
+    """
+    n = sims.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        empty = np.empty((sims.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(sims.dtype)
+    if k < n:
+        candidates = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n), (sims.shape[0], 1))
+    candidate_scores = np.take_along_axis(sims, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    positions = np.take_along_axis(candidates, order, axis=1)
+    return positions, np.take_along_axis(candidate_scores, order, axis=1)
+
+
+class SimilarityIndex:
+    """Cosine top-k search over latent drug vectors without building an N x N matrix.
+
+    storage="float16" or "int8" keeps the normalized vectors in half precision or
+    scalar-quantized (2x / 4x smaller than float32). The compressed scan selects
+    rerank_factor * k candidates, which are re-ranked with float32 vectors read from
+    `latent` (pass a memory-mapped array to keep only the compressed copy in RAM).
+    """
+
+    def __init__(self, drug_ids, latent, precompute_k=0, block_size=1024, storage="float32", rerank_factor=4):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"storage must be one of {STORAGE_TYPES}, got {storage!r}")
+        self.drug_ids = np.asarray(drug_ids, dtype=str)
+        self.positions = {drug_id: i for i, drug_id in enumerate(self.drug_ids)}
+        self.storage = storage
+        self.rerank_factor = rerank_factor
+        self.block_size = block_size
+        self.vectors, self.vector_scale = quantize(latent, storage)
+        # float32 source for re-ranking; not needed when the vectors are stored exactly
+        self.latent = None if storage == "float32" else latent
+        self.neighbors = None
+        self.neighbor_scores = None
+        if precompute_k:
+            self.precompute(precompute_k)
+
+    def __len__(self):
+        return len(self.drug_ids)
+
+    def __contains__(self, drug_id):
+        return drug_id in self.positions
+
+    @property
+    def nbytes(self):
+        """Memory held by the stored vectors (excluding the neighbor table)."""
+        scale_bytes = 0 if self.vector_scale is None else self.vector_scale.nbytes
+        return self.vectors.nbytes + scale_bytes
+
+    def float_vectors(self, rows):
+        """Exact L2-normalized float32 vectors for the given rows."""
+        if self.latent is None:
+            return self.vectors[rows]
+        return normalize_rows(self.latent[np.asarray(rows)])
+
+    def _scan(self, query_vectors, chunk_rows=65536):
+        """Scores of each query vector against every stored vector (compressed storage is
+        widened to float32 one chunk at a time)."""
+        if self.storage == "float32":
+            return query_vectors @ self.vectors.T
+        if self.vector_scale is not None:
+            # int8: fold the per-dimension scale into the queries
+            query_vectors = query_vectors * self.vector_scale
+        sims = np.empty((len(query_vectors), len(self)), dtype=np.float32)
+        for start in range(0, len(self), chunk_rows):
+            chunk = self.vectors[start:start + chunk_rows].astype(np.float32)
+            sims[:, start:start + chunk_rows] = query_vectors @ chunk.T
+        return sims
+
+    def _search_rows(self, rows, k):
+        """Top-k neighbors for indexed rows, computed in row blocks (memory is block_size x N)."""
+        neighbors = np.empty((len(rows), k), dtype=np.int64)
+        scores = np.empty((len(rows), k), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block_rows = rows[start:start + self.block_size]
+            block = slice(start, start + len(block_rows))
+            query_vectors = self.float_vectors(block_rows)
+            sims = self._scan(query_vectors)
+            # A drug is never its own neighbor
+            sims[np.arange(len(block_rows)), block_rows] = -np.inf
+            if self.latent is None:
+                neighbors[block], scores[block] = top_k_rows(sims, k)
+                continue
+
+            # Re-rank the compressed scan's best candidates with exact float32 scores
+            num_candidates = min(k * self.rerank_factor, len(self) - 1)
+            candidates, _ = top_k_rows(sims, num_candidates)
+            candidate_vectors = self.float_vectors(candidates.ravel()).reshape(*candidates.shape, -1)
+            exact = np.einsum("qd,qmd->qm", query_vectors, candidate_vectors)
+            top, scores[block] = top_k_rows(exact, k)
+            neighbors[block] = np.take_along_axis(candidates, top, axis=1)
+        return neighbors, scores
+
+    def precompute(self, k):
+        """Build a top-k neighbor table one row block at a time (memory is block_size x N)."""
+        k = min(k, len(self) - 1)
+        self.neighbors, self.neighbor_scores = self._search_rows(np.arange(len(self)), k)
+        return self
+
+    def set_table(self, neighbors, neighbor_scores):
+        """Attach a neighbor table computed earlier (e.g. loaded with a model artifact)."""
+        self.neighbors = np.asarray(neighbors, dtype=np.int64)
+        self.neighbor_scores = np.asarray(neighbor_scores, dtype=np.float32)
+        return self
+
+    def updated(self, drug_ids, latent, changed_ids):
+        """A new index after drugs were added, changed or removed, patching the neighbor table.
+
+        Vectors of drugs not listed in changed_ids must be unchanged. Unchanged rows are
+        only compared against the changed rows and merged with their existing neighbors;
+        rows that lost a listed neighbor (changed or removed) and changed rows themselves
+        are recomputed in full. The result matches a fresh precompute (up to the order of
+        exactly tied scores).
+        """
+        index = SimilarityIndex(drug_ids, latent, block_size=self.block_size,
+                                storage=self.storage, rerank_factor=self.rerank_factor)
+        if self.neighbors is None:
+            return index
+        k = min(self.neighbors.shape[1], len(index) - 1)
+
+        changed = np.array([drug_id not in self.positions for drug_id in index.drug_ids])
+        for drug_id in changed_ids:
+            if drug_id in index.positions:
+                changed[index.positions[drug_id]] = True
+        changed_rows = np.flatnonzero(changed)
+        stable_rows = np.flatnonzero(~changed)
+
+        # Old row -> new row, or -1 where the drug was removed or its vector changed
+        old_to_new = np.array([index.positions.get(drug_id, -1) for drug_id in self.drug_ids], dtype=np.int64)
+        old_to_new[(old_to_new >= 0) & changed[old_to_new]] = -1
+
+        old_rows = np.array([self.positions[drug_id] for drug_id in index.drug_ids[stable_rows]], dtype=np.int64)
+        kept = old_to_new[self.neighbors[old_rows, :k]] if len(old_rows) else np.empty((0, k), dtype=np.int64)
+        kept_scores = np.where(kept >= 0, self.neighbor_scores[old_rows, :k], -np.inf).astype(np.float32)
+        complete = (kept >= 0).all(axis=1)
+
+        neighbors = np.empty((len(index), k), dtype=np.int64)
+        scores = np.empty((len(index), k), dtype=np.float32)
+        merge = np.flatnonzero(complete)
+        for start in range(0, len(merge), self.block_size):
+            block = merge[start:start + self.block_size]
+            rows = stable_rows[block]
+            changed_scores = index.float_vectors(rows) @ index.float_vectors(changed_rows).T
+            candidate_scores = np.hstack([kept_scores[block], changed_scores])
+            candidates = np.hstack([kept[block], np.broadcast_to(changed_rows, (len(block), len(changed_rows)))])
+            top, top_scores = top_k_rows(candidate_scores, k)
+            neighbors[rows] = np.take_along_axis(candidates, top, axis=1)
+            scores[rows] = top_scores
+
+        recompute = np.concatenate([changed_rows, stable_rows[~complete]])
+        neighbors[recompute], scores[recompute] = index._search_rows(recompute, k)
+        return index.set_table(neighbors, scores)
+
+    def query(self, drug_id, k=5):
+        """Return (neighbor_ids, scores) for drug_id, or None if the ID is not indexed."""
+        row = self.positions.get(drug_id)
+        if row is None:
+            return None
+        k = min(k, len(self) - 1)
+        if self.neighbors is not None and k <= self.neighbors.shape[1]:
+            positions = self.neighbors[row, :k]
+            return self.drug_ids[positions], self.neighbor_scores[row, :k]
+
+        positions, scores = self._search_rows(np.array([row]), k)
+        return self.drug_ids[positions[0]], scores[0]
+
+    def query_batch(self, drug_ids, k=5):
+        """Neighbors for many drug IDs with one blocked matrix product and row-wise argpartition."""
+        query_ids = np.asarray(drug_ids, dtype=str)
+        rows = np.array([self.positions.get(drug_id, -1) for drug_id in query_ids], dtype=np.int64)
+        missing = rows < 0
+        k = min(k, len(self) - 1)
+
+        neighbors = np.zeros((len(query_ids), k), dtype=np.int64)
+        scores = np.full((len(query_ids), k), np.nan, dtype=np.float32)
+        hits = np.flatnonzero(~missing)
+        if self.neighbors is not None and k <= self.neighbors.shape[1]:
+            neighbors[hits] = self.neighbors[rows[hits], :k]
+            scores[hits] = self.neighbor_scores[rows[hits], :k]
+        else:
+            neighbors[hits], scores[hits] = self._search_rows(rows[hits], k)
+
+        neighbor_ids = self.drug_ids[neighbors]
+        neighbor_ids[missing] = ""
+        return BatchResult(query_ids, neighbor_ids, scores, missing)
+
+
+def recall_at_k(neighbor_ids, exact_neighbor_ids):
+    """Mean fraction of each query's exact top-k neighbors found in the approximate lists."""
+    if len(exact_neighbor_ids) == 0:
+        return 1.0
+    found = [len(np.intersect1d(approx, exact)) for approx, exact in zip(neighbor_ids, exact_neighbor_ids)]
+    return float(np.mean(found)) / exact_neighbor_ids.shape[1]
+
+
+def storage_report(drug_ids, latent, k=10, sample_size=1000, storages=STORAGE_TYPES, rerank_factor=4, seed=0):
+    """Vector memory, recall@k and query latency per storage type versus exact float32 search."""
+    exact = SimilarityIndex(drug_ids, latent)
+    rng = np.random.default_rng(seed)
+    sample = exact.drug_ids[rng.choice(len(exact), size=min(sample_size, len(exact)), replace=False)]
+    reference = exact.query_batch(sample, k)
+
+    report = []
+    for storage in storages:
+        index = exact if storage == "float32" else SimilarityIndex(
+            drug_ids, latent, storage=storage, rerank_factor=rerank_factor)
+        start = time.perf_counter()
+        result = index.query_batch(sample, k)
+        elapsed = time.perf_counter() - start
+        report.append({
+            "storage": storage,
+            "vector_bytes": index.nbytes,
+            f"recall@{k}": recall_at_k(result.neighbor_ids, reference.neighbor_ids),
+            "ms_per_query": 1000 * elapsed / max(len(sample), 1),
+        })
+    return report
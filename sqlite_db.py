@@ -0,0 +1,36 @@
+"""SQLite helpers shared by the caches and the results store."""
+import contextlib
+import os
+import sqlite3
+
+STATS_TABLE = "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+
+
+def ensure_parent_dir(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+@contextlib.contextmanager
+def connect(path):
+    """A WAL-mode connection committed on success and closed on exit.
+
+    One short-lived connection per operation is safe across Streamlit's script threads.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def increment(conn, name, amount=1):
+    """Add amount to a counter in the stats table (see STATS_TABLE)."""
+    conn.execute(
+        "INSERT INTO stats (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+        (name, amount),
+    )
@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import namedtuple
+
+import httpx
+
+import metrics
+
+DEFAULT_HTTP_CACHE_DIR = "./cache/http"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# content: document bytes; content_type: from the response headers;
+# not_modified: True when the server answered 304 and the cached copy was used
+FetchResult = namedtuple("FetchResult", ["content", "content_type", "not_modified"])
+
+
+class FetchError(Exception):
+    pass
+
+
+class DocumentTooLarge(FetchError):
+    pass
+
+
+class UrlFetcher:
+    """Single-request document fetcher on a shared, pooled HTTP client.
+
+    Each fetch is one streamed GET: the content type is read from the response
+    headers, the download stops once max_bytes is exceeded, transient failures
+    (connection errors, 429, 5xx) are retried with jittered exponential backoff
+    (a server's Retry-After is honoured up to max_backoff seconds),
+    and ETag / Last-Modified validators are stored on disk so refetching an
+    unchanged document costs a 304. Cached documents unused for max_cache_age_seconds
+    are dropped, and the least recently used go once they exceed max_cache_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_HTTP_CACHE_DIR, max_bytes=50 * 1024 * 1024, timeout=30.0,
+                 max_retries=3, backoff=0.5, max_backoff=30.0, max_connections=20,
+                 max_cache_bytes=1024 * 1024 * 1024, max_cache_age_seconds=30 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_cache_bytes = max_cache_bytes
+        self.max_cache_age_seconds = max_cache_age_seconds
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.client = httpx.Client(timeout=timeout, limits=self.limits, follow_redirects=True)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def close(self):
+        self.client.close()
+
+    def async_client(self, max_connections=None):
+        """A pooled AsyncClient with the same settings, for use inside one event loop."""
+        limits = self.limits if max_connections is None else httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections)
+        return httpx.AsyncClient(timeout=self.timeout, limits=limits, follow_redirects=True)
+
+    # ---- conditional-request cache ----
+
+    def _cache_paths(self, url):
+        name = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, name + ".json"), os.path.join(self.cache_dir, name + ".body")
+
+    def _cached(self, url):
+        if not self.cache_dir:
+            return None
+        meta_path, body_path = self._cache_paths(url)
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None
+        if time.time() - os.path.getmtime(body_path) > self.max_cache_age_seconds:
+            self._remove(url)
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _remove(self, url):
+        for path in self._cache_paths(url):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Drop cached documents unused for max_cache_age_seconds, then the least recently
+        used (by body mtime, refreshed on every hit) until the bodies fit max_cache_bytes."""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".body"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path[:-len(".body")]))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for mtime, size, base in entries:
+            if now - mtime <= self.max_cache_age_seconds and total <= self.max_cache_bytes:
+                break
+            for path in (base + ".body", base + ".json"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted += 1
+        if evicted:
+            metrics.count("fetch_cache_evictions", evicted)
+
+    def _request_headers(self, cached):
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        return headers
+
+    def _store(self, url, response, content):
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if not self.cache_dir or not (etag or last_modified):
+            return
+        meta_path, body_path = self._cache_paths(url)
+        with open(body_path + ".tmp", "wb") as f:
+            f.write(content)
+        os.replace(body_path + ".tmp", body_path)
+        with open(meta_path, "w") as f:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified,
+                       "content_type": response.headers.get("Content-Type", "")}, f)
+        self._evict()
+
+    def _from_cache(self, url, cached):
+        metrics.count("fetch_requests", result="not_modified")
+        _, body_path = self._cache_paths(url)
+        with open(body_path, "rb") as f:
+            content = f.read()
+        os.utime(body_path)  # recently used: evicted last
+        return FetchResult(content, cached.get("content_type", ""), True)
+
+    def _check_length(self, response):
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > self.max_bytes:
+            raise DocumentTooLarge(f"Document is {int(declared)} bytes, limit is {self.max_bytes}")
+
+    def _append(self, body, chunk):
+        body.extend(chunk)
+        if len(body) > self.max_bytes:
+            raise DocumentTooLarge(f"Document exceeds the {self.max_bytes} byte limit")
+
+    def _retry_delay(self, attempt, response=None):
+        metrics.count("fetch_retries")
+        retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+        if retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return min(self.backoff * (2 ** attempt) * (1 + random.random()), self.max_backoff)
+
+    def _should_retry(self, attempt, response=None):
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS_CODES
+
+    # ---- fetching ----
+
+    def _downloaded(self, url, response, content):
+        self._store(url, response, content)
+        metrics.count("fetch_requests", result="downloaded")
+        metrics.observe("fetch_bytes", len(content))
+        return FetchResult(content, response.headers.get("Content-Type", ""), False)
+
+    def fetch(self, url):
+        with metrics.span("fetch"):
+            return self._fetch(url)
+
+    def _fetch(self, url):
+        cached = self._cached(url)
+        headers = self._request_headers(cached)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and cached:
+                        return self._from_cache(url, cached)
+                    if self._should_retry(attempt, response):
+                        delay = self._retry_delay(attempt, response)
+                    else:
+                        response.raise_for_status()
+                        self._check_length(response)
+                        body = bytearray()
+                        for chunk in response.iter_bytes():
+                            self._append(body, chunk)
+                        return self._downloaded(url, response, bytes(body))
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt):
+                    raise FetchError(f"Could not fetch {url}: {e}") from e
+                delay = self._retry_delay(attempt)
+            except httpx.HTTPStatusError as e:
+                raise FetchError(f"Could not fetch {url}: HTTP {e.response.status_code}") from e
+            time.sleep(delay)
+
+    async def fetch_async(self, http_client, url):
+        """Same as fetch, on an AsyncClient owned by the caller's event loop."""
+        with metrics.span("fetch"):
+            return await self._fetch_async(http_client, url)
+
+    async def _fetch_async(self, http_client, url):
+        cached = self._cached(url)
+        headers = self._request_headers(cached)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with http_client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and cached:
+                        return self._from_cache(url, cached)
+                    if self._should_retry(attempt, response):
+                        delay = self._retry_delay(attempt, response)
+                    else:
+                        response.raise_for_status()
+                        self._check_length(response)
+                        body = bytearray()
+                        async for chunk in response.aiter_bytes():
+                            self._append(body, chunk)
+                        return self._downloaded(url, response, bytes(body))
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt):
+                    raise FetchError(f"Could not fetch {url}: {e}") from e
+                delay = self._retry_delay(attempt)
+            except httpx.HTTPStatusError as e:
+                raise FetchError(f"Could not fetch {url}: HTTP {e.response.status_code}") from e
+            await asyncio.sleep(delay)